@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .auth import forget_logged_out_user, forget_user
+        from .cache import clear_after_migrate
+        from .sqlite import configure_connection
+        connection_created.connect(configure_connection)
+        post_migrate.connect(clear_after_migrate, sender=self)
+        post_save.connect(forget_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(forget_user, sender=settings.AUTH_USER_MODEL)
+        user_logged_out.connect(forget_logged_out_user)
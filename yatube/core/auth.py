@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY, get_user)
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from yatube.settings import AUTH_USER_CACHE_TIMEOUT
+
+USER_KEY = 'auth_user:{}'
+
+
+def resolve_user(request):
+    """Пользователь сессии: из кэша, если он там есть и сессия
+    по-прежнему действительна, иначе обычным путём Django.
+    """
+    user_id = request.session.get(SESSION_KEY)
+    if user_id is None:
+        return AnonymousUser()
+    key = USER_KEY.format(user_id)
+    user = cache.get(key)
+    if user is not None and session_is_valid(request, user):
+        return user
+    user = get_user(request)
+    if user.is_authenticated:
+        cache.set(key, user, AUTH_USER_CACHE_TIMEOUT)
+    return user
+
+
+def session_is_valid(request, user):
+    # Те же проверки, что в django.contrib.auth.get_user.
+    if request.session.get(BACKEND_SESSION_KEY) not in (
+        settings.AUTHENTICATION_BACKENDS
+    ):
+        return False
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    return bool(session_hash) and constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    )
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware, берущая пользователя из кэша.
+
+    Вместе с сессиями в кэше (`cached_db`) страница авторизованного
+    пользователя при тёплом кэше не делает запросов ради входа.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
+
+
+def get_cached_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = resolve_user(request)
+    return request._cached_user
+
+
+def forget_user(sender, instance, **kwargs):
+    """Сохранение пользователя, в том числе смена пароля через
+    PasswordChangeView, убирает его копию из кэша.
+    """
+    cache.delete(USER_KEY.format(instance.pk))
+
+
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        cache.delete(USER_KEY.format(user.pk))
@@ -0,0 +1,183 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.functional import cached_property
+
+
+class SharedFileCache(FileBasedCache):
+    """Файловый кэш, общий для всех процессов на машине.
+
+    В отличие от FileBasedCache, `add` атомарен: файл записи появляется
+    через `os.link`, который не перезаписывает существующий файл. На этом
+    держатся блокировки в кэше.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # has_key заодно удаляет файл просроченной записи.
+        if self.has_key(key, version):
+            return False
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            os.link(tmp_path, fname)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш: LRU процесса перед общим кэшем из `LOCATION`.
+
+    Локальная копия живёт не дольше `LOCAL_TIMEOUT` секунд, записей
+    в LRU не больше `MAX_ENTRIES`. Ключи с префиксами из `SHARED_PREFIXES`
+    (версии областей, блокировки) читаются только из общего кэша: смена
+    версии сразу видна всем процессам, а устаревшие локальные копии
+    страниц отбрасываются по несовпадению версий.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.shared_prefixes = tuple(options.get('SHARED_PREFIXES', ()))
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    @cached_property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def is_local(self, key):
+        return not key.startswith(self.shared_prefixes)
+
+    def get_local(self, key, version):
+        local_key = self.make_key(key, version)
+        with self.lock:
+            item = self.local.get(local_key)
+            if item is None:
+                return None
+            expiry, data = item
+            if expiry < time.monotonic():
+                del self.local[local_key]
+                return None
+            self.local.move_to_end(local_key)
+        return data
+
+    def set_local(self, key, value, timeout, version):
+        if not self.is_local(key):
+            return
+        timeout = self.get_backend_timeout(timeout)
+        lifetime = self.local_timeout
+        if timeout is not None:
+            lifetime = min(lifetime, timeout - time.time())
+        if lifetime <= 0:
+            self.delete_local(key, version)
+            return
+        # Храним pickle, чтобы запросы не делили один изменяемый объект.
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        local_key = self.make_key(key, version)
+        with self.lock:
+            self.local[local_key] = (time.monotonic() + lifetime, data)
+            self.local.move_to_end(local_key)
+            while len(self.local) > self._max_entries:
+                self.local.popitem(last=False)
+
+    def delete_local(self, key, version):
+        with self.lock:
+            self.local.pop(self.make_key(key, version), None)
+
+    def get(self, key, default=None, version=None):
+        if self.is_local(key):
+            data = self.get_local(key, version)
+            if data is not None:
+                return pickle.loads(data)
+        value = self.shared.get(key, self, version)
+        if value is self:
+            return default
+        self.set_local(key, value, self.local_timeout, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        for key in keys:
+            data = self.get_local(key, version) if self.is_local(key) else None
+            if data is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(data)
+        if missing:
+            shared = self.shared.get_many(missing, version)
+            for key, value in shared.items():
+                self.set_local(key, value, self.local_timeout, version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        self.shared.set(key, value, timeout, version)
+        self.set_local(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            self.set_local(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        if not self.shared.add(key, value, timeout, version):
+            return False
+        self.set_local(key, value, timeout, version)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.delete_local(key, version)
+        return self.shared.touch(key, self._timeout(timeout), version)
+
+    def delete(self, key, version=None):
+        self.delete_local(key, version)
+        self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.delete_local(key, version)
+        self.shared.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        if self.is_local(key) and self.get_local(key, version) is not None:
+            return True
+        return self.shared.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.delete_local(key, version)
+        return self.shared.incr(key, delta, version)
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+        self.shared.clear()
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+
+def clear_after_migrate(using, **kwargs):
+    """Общий кэш переживает перезапуск и пересоздание базы; после
+    миграций страницы в нём могут не соответствовать данным.
+    """
+    caches['default'].clear()
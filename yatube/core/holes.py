@@ -0,0 +1,43 @@
+import re
+
+from django.core import signing
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+HOLE_SALT = 'core.holes'
+HOLE = re.compile(r'<!--hole ([\w.:-]+)-->')
+
+
+def render_hole(request, template_name, params):
+    """Фрагмент страницы, зависящий от пользователя.
+
+    Если страница собирается для общего кэша (`request.punch_holes`),
+    на месте фрагмента остаётся подписанная метка, которую `fill_holes`
+    заменит при каждом ответе. Иначе фрагмент рисуется сразу.
+    """
+    if getattr(request, 'punch_holes', False):
+        payload = signing.dumps([template_name, params], salt=HOLE_SALT)
+        return mark_safe(f'<!--hole {payload}-->')
+    return render_to_string(template_name, params, request)
+
+
+def fill_holes(request, response):
+    """Подставляет в ответ фрагменты для текущего пользователя."""
+    if response.streaming or 'text/html' not in response.get(
+        'Content-Type', ''
+    ):
+        return response
+
+    def render(match):
+        try:
+            template_name, params = signing.loads(
+                match.group(1), salt=HOLE_SALT
+            )
+        except signing.BadSignature:
+            return ''
+        return render_to_string(template_name, params, request)
+
+    response.content = HOLE.sub(
+        render, response.content.decode(response.charset)
+    )
+    return response
@@ -0,0 +1,69 @@
+from django.http import Http404
+
+ATTRIBUTE = '_identity_map'
+
+
+class IdentityMap:
+    """Объекты моделей, уже загруженные за время запроса.
+
+    Объект находится по модели и значению уникального поля, по которому
+    его загружали, а также по первичному ключу. Связанные объекты,
+    пришедшие через select_related, запоминаются вместе с ним. Объект
+    отдаётся таким, каким его загрузили первым, поэтому первым грузить
+    стоит самый полный вариант — со связями и аннотациями.
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def key(self, model, field, value):
+        if field in ('id', model._meta.pk.name):
+            field = 'pk'
+        return model._meta.label, field, str(value)
+
+    def find(self, model, **lookup):
+        """Уже загруженный объект или None; lookup — одно поле."""
+        ((field, value),) = lookup.items()
+        return self.objects.get(self.key(model, field, value))
+
+    def add(self, obj, **lookup):
+        pk_key = self.key(type(obj), 'pk', obj.pk)
+        if self.objects.get(pk_key) is obj:
+            return
+        self.objects[pk_key] = obj
+        for field, value in lookup.items():
+            self.objects[self.key(type(obj), field, value)] = obj
+        for related in obj._state.fields_cache.values():
+            if related is not None and hasattr(related, '_state'):
+                self.add(related)
+
+    def get(self, queryset, **lookup):
+        """Объект из карты или из queryset; DoesNotExist, если его нет."""
+        obj = self.find(queryset.model, **lookup)
+        if obj is None:
+            obj = queryset.get(**lookup)
+            self.add(obj, **lookup)
+        return obj
+
+
+def identity_map(request):
+    """Карта объектов текущего запроса, создаётся при первом обращении."""
+    if not hasattr(request, ATTRIBUTE):
+        setattr(request, ATTRIBUTE, IdentityMap())
+    return getattr(request, ATTRIBUTE)
+
+
+def clear_identity_map(request):
+    """Забывает загруженные объекты, например прочитанные с реплики."""
+    if hasattr(request, ATTRIBUTE):
+        delattr(request, ATTRIBUTE)
+
+
+def load_object_or_404(request, queryset, **lookup):
+    """Как get_object_or_404, но через карту объектов запроса."""
+    try:
+        return identity_map(request).get(queryset, **lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(
+            f'No {queryset.model._meta.object_name} matches the given query.'
+        )
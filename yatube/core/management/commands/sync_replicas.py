@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплики для чтения, один раз '
+            'или каждые --interval секунд.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases',
+            nargs='*',
+            help='Реплики из DATABASES; по умолчанию все, кроме default.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Период синхронизации в секундах; 0 — один раз.',
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or [
+            alias for alias in connections if alias != DEFAULT_DB_ALIAS
+        ]
+        source = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        while True:
+            for alias in aliases:
+                copy_database(source, connections[alias].settings_dict['NAME'])
+            self.stdout.write(f'Синхронизировано реплик: {len(aliases)}')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,380 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: файлы завершившихся процессов не сворачиваются.
+    fcntl = None
+
+# Метрика: (описание, границы корзин гистограммы).
+METRICS = {
+    'request_duration_seconds': (
+        'Время обработки запроса',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    ),
+    'sql_queries': (
+        'Число SQL-запросов за один запрос',
+        (0, 1, 2, 5, 10, 20, 50, 100),
+    ),
+    'sql_duration_seconds': (
+        'Время SQL-запросов за один запрос',
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    ),
+    'template_render_seconds': (
+        'Время отрисовки шаблонов за один запрос',
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    ),
+    'response_size_bytes': (
+        'Размер ответа',
+        (1000, 5000, 10000, 25000, 50000, 100000, 250000, 1000000),
+    ),
+}
+# Счётчик: описание; значения ведутся по набору меток.
+COUNTERS = {
+    'feed_cache_total': 'Обращения к кэшу лент: hit, miss или stale',
+}
+PREFIX = 'yatube_'
+# Сюда сворачиваются метрики завершившихся процессов.
+RETIRED = 'retired'
+
+
+class Registry:
+    """Гистограммы по view и счётчики текущего процесса.
+
+    Раз в `METRICS_FLUSH_INTERVAL` секунд процесс сбрасывает их в свой
+    файл в `METRICS_DIR`, а `/metrics` складывает файлы всех процессов.
+    Файл назван по pid и времени старта: процесс с тем же pid после
+    перезапуска не затрёт файл предшественника. Пока процесс жив, он
+    держит flock на `<имя>.lock`, по нему `collect` узнаёт завершившиеся.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.counters = {}
+        self.flushed = 0
+        self.name = None
+        self.lock_file = None
+
+    def observe(self, view_name, values):
+        with self.lock:
+            view = self.data.setdefault(view_name, {})
+            for metric, value in values.items():
+                buckets = METRICS[metric][1]
+                series = view.setdefault(metric, {
+                    'buckets': [0] * len(buckets),
+                    'sum': 0,
+                    'count': 0,
+                })
+                for i, bound in enumerate(buckets):
+                    if value <= bound:
+                        series['buckets'][i] += 1
+                series['sum'] += value
+                series['count'] += 1
+        self.maybe_flush()
+
+    def increment(self, metric, **labels):
+        label = ','.join(
+            f'{name}="{value}"' for name, value in sorted(labels.items())
+        )
+        with self.lock:
+            values = self.counters.setdefault(metric, {})
+            values[label] = values.get(label, 0) + 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed > settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            payload = json.dumps({
+                'histograms': self.data,
+                'counters': self.counters,
+            })
+            self.flushed = time.monotonic()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        if self.name is None:
+            self.claim_name()
+        write_json(
+            os.path.join(settings.METRICS_DIR, f'{self.name}.json'), payload
+        )
+
+    def claim_name(self):
+        self.name = f'{os.getpid()}-{time.time_ns()}'
+        if fcntl is None:
+            return
+        # Файл блокировки появляется под своим именем уже занятым,
+        # иначе `collect` успел бы счесть процесс завершившимся.
+        path = os.path.join(settings.METRICS_DIR, f'{self.name}.lock')
+        self.lock_file = open(path + '.tmp', 'w')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        os.replace(path + '.tmp', path)
+
+    def after_fork(self):
+        # Данные родителя уже в его файле, а flock принадлежит его
+        # открытому файлу: дочерний процесс начинает с чистого листа.
+        self.__init__()
+
+
+registry = Registry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.after_fork)
+
+
+def write_json(path, payload):
+    with open(path + '.tmp', 'w') as file:
+        file.write(payload)
+    os.replace(path + '.tmp', path)
+
+
+def read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def collect():
+    """Складывает метрики всех процессов из `METRICS_DIR`."""
+    registry.flush()
+    directory = settings.METRICS_DIR
+    with retired_lock(directory):
+        retire_finished(directory)
+        retired = read_json(os.path.join(directory, f'{RETIRED}.json'))
+        folded = set((retired or {}).get('processes', ()))
+        total = {'histograms': {}, 'counters': {}}
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            name = os.path.basename(path)[:-len('.json')]
+            if name in folded:
+                continue
+            data = read_json(path)
+            if data is None:
+                continue
+            merge_histograms(total['histograms'], data.get('histograms', {}))
+            merge_counters(total['counters'], data.get('counters', {}))
+    return total
+
+
+@contextmanager
+def retired_lock(directory):
+    """Сворачивание и подсчёт не пересекаются с другими процессами."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, f'{RETIRED}.lock'), 'a') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        yield
+
+
+def retire_finished(directory):
+    """Сворачивает файлы завершившихся процессов в `retired.json`.
+
+    Их метрики прибавляются к накопленным, так что суммы счётчиков не
+    уменьшаются, а каталог не растёт с каждым перезапуском воркера.
+    Имена свёрнутых файлов записываются вместе с суммой: если процесс
+    упадёт до удаления файла, файл не посчитается дважды. Вызывается
+    под `retired_lock`.
+    """
+    if fcntl is None:
+        return
+    retired_path = os.path.join(directory, f'{RETIRED}.json')
+    finished = finished_processes(directory)
+    if not finished:
+        return
+    retired = read_json(retired_path) or {
+        'histograms': {}, 'counters': {}, 'processes': [],
+    }
+    folded = set(retired['processes'])
+    for name in finished:
+        if name in folded:
+            continue
+        data = read_json(os.path.join(directory, f'{name}.json')) or {}
+        merge_histograms(retired['histograms'], data.get('histograms', {}))
+        merge_counters(retired['counters'], data.get('counters', {}))
+        retired['processes'].append(name)
+    write_json(retired_path, json.dumps(retired))
+    for name in finished:
+        for extension in ('json', 'lock'):
+            try:
+                os.remove(os.path.join(directory, f'{name}.{extension}'))
+            except FileNotFoundError:
+                pass
+    # Удалённые файлы уже не посчитаются, их имена можно забыть.
+    retired['processes'] = [
+        name for name in retired['processes'] if name not in finished
+    ]
+    write_json(retired_path, json.dumps(retired))
+
+
+def finished_processes(directory):
+    names = []
+    for lock_path in glob.glob(os.path.join(directory, '*.lock')):
+        name = os.path.basename(lock_path)[:-len('.lock')]
+        if name != RETIRED and not is_running(lock_path):
+            names.append(name)
+    return names
+
+
+def is_running(lock_path):
+    """Держит ли ещё процесс flock на своём файле блокировки."""
+    try:
+        with open(lock_path) as file:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def merge_histograms(total, data):
+    for view_name, metrics in data.items():
+        view = total.setdefault(view_name, {})
+        for metric, series in metrics.items():
+            if metric not in METRICS:
+                continue
+            merged = view.setdefault(metric, {
+                'buckets': [0] * len(METRICS[metric][1]),
+                'sum': 0,
+                'count': 0,
+            })
+            for i, value in enumerate(series['buckets']):
+                merged['buckets'][i] += value
+            merged['sum'] += series['sum']
+            merged['count'] += series['count']
+
+
+def merge_counters(total, data):
+    for metric, values in data.items():
+        if metric not in COUNTERS:
+            continue
+        merged = total.setdefault(metric, {})
+        for label, value in values.items():
+            merged[label] = merged.get(label, 0) + value
+
+
+def render_prometheus(total):
+    """Метрики в текстовом формате Prometheus."""
+    lines = []
+    for metric, description in COUNTERS.items():
+        name = PREFIX + metric
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        values = total['counters'].get(metric, {})
+        for label in sorted(values):
+            lines.append(f'{name}{{{label}}} {values[label]}')
+    histograms = total['histograms']
+    for metric, (description, buckets) in METRICS.items():
+        name = PREFIX + metric
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for view_name in sorted(histograms):
+            series = histograms[view_name].get(metric)
+            if series is None:
+                continue
+            label = f'view="{view_name}"'
+            for bound, value in zip(buckets, series['buckets']):
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {value}')
+            lines.append(
+                f'{name}_bucket{{{label},le="+Inf"}} {series["count"]}'
+            )
+            lines.append(f'{name}_sum{{{label}}} {series["sum"]}')
+            lines.append(f'{name}_count{{{label}}} {series["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """Обёртка `execute_wrapper`, считающая SQL-запросы и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Снимает метрики каждого запроса по имени view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.template_seconds = 0
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view_name = match.view_name if match is not None else 'unresolved'
+        registry.observe(view_name, {
+            'request_duration_seconds': duration,
+            'sql_queries': timer.count,
+            'sql_duration_seconds': timer.seconds,
+            'template_render_seconds': request.template_seconds,
+            'response_size_bytes': (
+                0 if response.streaming else len(response.content)
+            ),
+        })
+        return response
+
+
+# Глубина вложенных отрисовок в текущем потоке.
+render_depth = threading.local()
+
+
+class TimedTemplate(DjangoTemplate):
+    """Шаблон, прибавляющий время отрисовки к запросу.
+
+    Теги вроде `{% hole %}` рисуют вложенные шаблоны через тот же
+    шаблонизатор, и их время уже входит во внешнюю отрисовку. Поэтому
+    засекается только внешняя: счётчик глубины в потоке пропускает
+    вложенные, а не помечает их отдельной меткой.
+    """
+
+    def render(self, context=None, request=None):
+        depth = getattr(render_depth, 'value', 0)
+        render_depth.value = depth + 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            render_depth.value = depth
+            if (depth == 0 and request is not None
+                    and hasattr(request, 'template_seconds')):
+                request.template_seconds += time.perf_counter() - start
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """Шаблонизатор Django, засекающий время отрисовки для метрик."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self
+        )
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self
+        )
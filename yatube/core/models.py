@@ -27,3 +27,12 @@ class CustomTextModel(models.Model):
 
     def __str__(self):
         return self.text[:15]
+
+
+class StoredFile(models.Model):
+    """Файл из хранилища по хэшу содержимого и число ссылок на него."""
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,106 @@
+import random
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD')
+# Кука, с которой пользователь после записи читает с основной базы.
+PIN_COOKIE = 'read_primary'
+# Сессии пишутся при входе и сразу читаются, реплика может их не знать.
+PRIMARY_APPS = ('sessions',)
+
+state = threading.local()
+
+
+class ReplicaRouter:
+    """Чтение GET-запросов — с реплик, всё остальное — с основной базы.
+
+    Реплики перечислены в `REPLICA_DATABASES`. Запрос, который уже
+    что-то записал, дочитывает с основной базы, а его автор ещё
+    `REPLICA_PIN_SECONDS` секунд читает оттуда же и видит свои записи,
+    даже если реплика отстаёт.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not getattr(state, 'use_replica', False)
+                or model._meta.app_label in PRIMARY_APPS
+                or not settings.REPLICA_DATABASES):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        state.use_replica = False
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними допустимы.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает в реплики вместе с данными при синхронизации.
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик на время GET-запроса и ставит куку
+    чтения с основной базы, если запрос что-то записал.
+
+    Стоит перед SessionMiddleware, чтобы сохранение сессии тоже
+    считалось записью.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state.use_replica = (
+            request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+        )
+        state.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = state.wrote
+        finally:
+            state.use_replica = state.wrote = False
+        if wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+@contextmanager
+def primary():
+    """Внутри блока чтение идёт с основной базы."""
+    previous = getattr(state, 'use_replica', False)
+    state.use_replica = False
+    try:
+        yield
+    finally:
+        state.use_replica = previous
+
+
+def reading_replica():
+    """Читает ли сейчас поток с реплик."""
+    return bool(
+        getattr(state, 'use_replica', False) and settings.REPLICA_DATABASES
+    )
+
+
+def copy_database(source, target):
+    """Согласованный снимок файла SQLite source в target.
+
+    Backup API копирует базу постранично под блокировкой чтения, так что
+    в реплику не попадёт недописанная транзакция.
+    """
+    with closing(sqlite3.connect(source)) as source_db, \
+            closing(sqlite3.connect(target)) as target_db:
+        source_db.backup(target_db)
@@ -0,0 +1,130 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+from .routers import primary
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: очередь работает только внутри процесса.
+    fcntl = None
+
+SAFE_METHODS = ('GET', 'HEAD')
+LOCKED_ERRORS = ('database is locked', 'database table is locked')
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Прагмы из `SQLITE_PRAGMAS` для каждого нового соединения SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    return any(message in str(error) for message in LOCKED_ERRORS)
+
+
+class WriteQueue:
+    """Очередь писателей SQLite: пишет один запрос на все процессы.
+
+    Потоки процесса ждут своей очереди на блокировке, процессы — на
+    flock файла `SQLITE_WRITE_LOCK`. SQLite всё равно допускает одного
+    писателя, а ожидание в очереди, в отличие от busy_timeout, не
+    кончается ошибкой `database is locked`. Вложенные записи того же
+    потока очередь уже не ждут.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.file = None
+
+    @contextmanager
+    def turn(self):
+        if getattr(self.local, 'depth', 0):
+            self.local.depth += 1
+            try:
+                yield
+            finally:
+                self.local.depth -= 1
+            return
+        with self.lock:
+            self.acquire_file()
+            self.local.depth = 1
+            try:
+                yield
+            finally:
+                self.local.depth = 0
+                self.release_file()
+
+    def acquire_file(self):
+        if fcntl is None:
+            return
+        if self.file is None:
+            self.file = open(settings.SQLITE_WRITE_LOCK, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def release_file(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def run(self, func, *args, **kwargs):
+        """Выполняет func в своей очереди и в транзакции.
+
+        Если базу всё же заблокировал писатель вне очереди, например
+        команда manage.py, транзакция откатывается и повторяется с
+        экспоненциальной задержкой. Поэтому всё, что не откатывается,
+        например удаление файлов, func откладывает в on_commit.
+        """
+        retries = settings.SQLITE_WRITE_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                # Читаем то, что собираемся менять, с основной базы.
+                with self.turn(), primary(), transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_locked(error) or attempt == retries:
+                    raise
+            time.sleep(
+                settings.SQLITE_WRITE_BACKOFF * 2 ** attempt
+                * (1 + random.random())
+            )
+
+    def after_fork(self):
+        # Блокировка flock принадлежит открытому файлу, дочернему
+        # процессу нужен свой.
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.file = None
+
+
+write_queue = WriteQueue()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=write_queue.after_fork)
+
+
+def single_writer(view=None, *, always=False):
+    """Изменяющие запросы к view проходят через очередь писателей.
+
+    С always=True очередь проходят и GET-запросы — для view, которые
+    пишут по ссылке, как подписка на автора.
+    """
+    if view is None:
+        return partial(single_writer, always=always)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if ((request.method in SAFE_METHODS and not always)
+                or not settings.SQLITE_SERIALIZE_WRITES):
+            return view(request, *args, **kwargs)
+        return write_queue.run(view, request, *args, **kwargs)
+    return wrapper
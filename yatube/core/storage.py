@@ -0,0 +1,102 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import StoredFile
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, которое называет файлы по SHA-256 содержимого.
+
+    Файл ложится в `<каталог>/ab/cd/abcd….ext`, одинаковые загрузки
+    хранятся один раз, а число ссылок на файл ведётся в `StoredFile`.
+    Физически файл удаляется, когда на него не остаётся ссылок.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if not self.exists(name):
+            try:
+                name = self._save(name, content)
+            except FileExistsError:
+                # Тот же файл успела записать параллельная загрузка.
+                pass
+        self.add_reference(name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое имя по хэшу — одинаковое содержимое: вместо копии
+        # с суффиксом `_save` сообщает, что файл уже есть.
+        if self.is_hashed(name) and self.exists(name):
+            raise FileExistsError(name)
+        return super().get_available_name(name, max_length)
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name),
+            hexdigest[:2],
+            hexdigest[2:4],
+            hexdigest + extension,
+        )
+
+    @staticmethod
+    def is_hashed(name):
+        return HASHED_NAME.search(name) is not None
+
+    @staticmethod
+    def add_reference(name):
+        updated = StoredFile.objects.filter(name=name).update(
+            references=F('references') + 1
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, references=1)
+        except IntegrityError:
+            StoredFile.objects.filter(name=name).update(
+                references=F('references') + 1
+            )
+
+    def delete(self, name):
+        """Снимает ссылку; файлы вне учёта `StoredFile` не трогает.
+
+        Сам файл удаляется после коммита: если транзакция откатится,
+        строка `StoredFile` вернётся, и файл должен остаться на месте.
+        """
+        released = StoredFile.objects.filter(
+            name=name, references__gt=1
+        ).update(references=F('references') - 1)
+        if released:
+            return
+        deleted, _ = StoredFile.objects.filter(name=name).delete()
+        if deleted:
+            transaction.on_commit(lambda: self.release(name))
+
+    def release(self, name):
+        # За время до коммита файл могли загрузить заново.
+        if not StoredFile.objects.filter(name=name).exists():
+            super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,44 @@
+from django import template
+from django.template.base import token_kwargs
+
+from ..holes import render_hole
+
+register = template.Library()
+
+
+class HoleNode(template.Node):
+    def __init__(self, template_name, params):
+        self.template_name = template_name
+        self.params = params
+
+    def render(self, context):
+        params = {
+            name: value.resolve(context)
+            for name, value in self.params.items()
+        }
+        return render_hole(
+            getattr(context, 'request', None),
+            self.template_name.resolve(context),
+            params,
+        )
+
+
+@register.tag
+def hole(parser, token):
+    """Дыра в кэшируемой странице: {% hole 'шаблон' имя=значение %}.
+
+    Шаблон фрагмента получает только переданные параметры и контекст
+    запроса; значения параметров должны сериализоваться в JSON.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} ожидает имя шаблона'
+        )
+    remaining = bits[2:]
+    params = token_kwargs(remaining, parser)
+    if remaining:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает только именованные параметры'
+        )
+    return HoleNode(parser.compile_filter(bits[1]), params)
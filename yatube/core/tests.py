@@ -0,0 +1,588 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from hashlib import sha256
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import OperationalError, connection, router, transaction
+from django.http import Http404, HttpResponse
+from django.template import engines
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+
+from posts.models import Group, Post
+
+from .auth import USER_KEY
+from .cache import SharedFileCache, TieredCache
+from .identity import identity_map, load_object_or_404
+from .metrics import Registry, collect
+from .models import StoredFile
+from .routers import PIN_COOKIE, ReplicaMiddleware, copy_database, primary
+from .sqlite import WriteQueue, single_writer, write_queue
+from .storage import ContentAddressedStorage
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CONTENT = b'GIF89a-test-content'
+HASHED_NAME = 'posts/{0}/{1}/{2}.gif'.format(
+    sha256(CONTENT).hexdigest()[:2],
+    sha256(CONTENT).hexdigest()[2:4],
+    sha256(CONTENT).hexdigest(),
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TransactionTestCase):
+    """Транзакции настоящие: файлы удаляются в on_commit."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.storage = ContentAddressedStorage()
+
+    def test_identical_uploads_are_stored_once(self):
+        """Одинаковые файлы получают одно имя и один счётчик ссылок."""
+        first = self.storage.save('posts/a.gif', ContentFile(CONTENT))
+        second = self.storage.save('posts/b.GIF', ContentFile(CONTENT))
+        self.assertEqual(first, HASHED_NAME)
+        self.assertEqual(second, HASHED_NAME)
+        self.assertEqual(StoredFile.objects.get(name=first).references, 2)
+
+    def test_file_is_removed_with_last_reference(self):
+        """Файл удаляется только вместе с последней ссылкой."""
+        name = self.storage.save('posts/a.gif', ContentFile(CONTENT))
+        self.storage.save('posts/b.gif', ContentFile(CONTENT))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_rolled_back_delete_keeps_file(self):
+        """Откат транзакции возвращает и ссылку, и файл."""
+        name = self.storage.save('posts/a.gif', ContentFile(CONTENT))
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.storage.delete(name)
+                raise RuntimeError
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+    def test_same_image_uploaded_again_keeps_one_reference(self):
+        """Повторная загрузка того же файла в пост не копит ссылки,
+        и после удаления поста файла не остаётся.
+        """
+        user = User.objects.create_user(username='username')
+        post = Post.objects.create(
+            author=user, text='Пост', image=ContentFile(CONTENT, 'a.gif')
+        )
+        post.image = ContentFile(CONTENT, 'b.gif')
+        post.save()
+        self.assertEqual(post.image.name, HASHED_NAME)
+        self.assertEqual(
+            StoredFile.objects.get(name=HASHED_NAME).references, 1
+        )
+        post.delete()
+        self.assertFalse(StoredFile.objects.filter(name=HASHED_NAME).exists())
+        self.assertFalse(self.storage.exists(HASHED_NAME))
+
+    def test_racing_upload_reuses_hashed_file(self):
+        """Если файл появился после проверки, копия не создаётся."""
+        name = self.storage.save('posts/a.gif', ContentFile(CONTENT))
+        checks = []
+        exists = self.storage.exists
+
+        def exists_after_first_check(name):
+            # Первая проверка в save() пропускает файл, как при гонке.
+            checks.append(name)
+            return len(checks) > 1 and exists(name)
+
+        self.storage.exists = exists_after_first_check
+        self.assertEqual(
+            self.storage.save('posts/b.gif', ContentFile(CONTENT)), name
+        )
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.storage.path(name))),
+            [os.path.basename(name)],
+        )
+
+    def test_migrate_media_storage_rewrites_post_images(self):
+        """Команда переносит старые картинки и переписывает пути."""
+        user = User.objects.create_user(username='username')
+        FileSystemStorage().save('posts/image_0001.gif', ContentFile(CONTENT))
+        FileSystemStorage().save('posts/image_0002.gif', ContentFile(CONTENT))
+        posts = [
+            Post.objects.create(author=user, text='Пост', image=name)
+            for name in ('posts/image_0001.gif', 'posts/image_0002.gif')
+        ]
+        call_command('migrate_media_storage', stdout=StringIO())
+        for post in posts:
+            with self.subTest(post=post.pk):
+                post.refresh_from_db()
+                self.assertEqual(post.image.name, HASHED_NAME)
+        self.assertEqual(
+            StoredFile.objects.get(name=HASHED_NAME).references, 2
+        )
+        self.assertFalse(self.storage.exists('posts/image_0001.gif'))
+
+
+@override_settings(METRICS_DIR=TEMP_MEDIA_ROOT, METRICS_FLUSH_INTERVAL=0)
+class MetricsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_metrics_are_collected_per_view(self):
+        """/metrics отдаёт гистограммы по имени view."""
+        client = Client()
+        client.get(reverse('posts:index'))
+        response = client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        for metric in (
+            'yatube_request_duration_seconds_count{view="posts:index"}',
+            'yatube_sql_queries_bucket{view="posts:index",le="+Inf"}',
+            'yatube_template_render_seconds_sum{view="posts:index"}',
+            'yatube_response_size_bytes_count{view="posts:index"}',
+            'yatube_feed_cache_total{result="miss",view="posts:index"}',
+        ):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, body)
+
+    def test_nested_renders_are_counted_once(self):
+        """Время шаблона из `{% hole %}` уже входит во внешний шаблон
+        и не прибавляется ещё раз.
+        """
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.template_seconds = 0
+        template = engines.all()[0].from_string(
+            "{% load holes %}{% hole 'posts/includes/trending_groups.html' %}"
+        )
+        # Часы идут на секунду за вызов: вложенная отрисовка тоже
+        # занимает время, но в сумму входит только внешняя.
+        readings = []
+
+        def perf_counter():
+            readings.append(len(readings))
+            return readings[-1]
+
+        with patch('core.metrics.time') as clock:
+            clock.perf_counter.side_effect = perf_counter
+            template.render(request=request)
+        self.assertEqual(
+            request.template_seconds, readings[-1] - readings[0]
+        )
+
+    def test_finished_processes_are_folded(self):
+        """Файл завершившегося процесса сворачивается, а его счётчики
+        остаются в сумме; файл живого процесса не трогается.
+        """
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory)
+        label = 'result="hit",view="posts:index"'
+        with open(os.path.join(directory, '1-1.json'), 'w') as file:
+            json.dump({'counters': {'feed_cache_total': {label: 3}}}, file)
+        open(os.path.join(directory, '1-1.lock'), 'w').close()
+        with override_settings(METRICS_DIR=directory):
+            running = Registry()
+            running.increment('feed_cache_total', result='hit', view='x')
+            running.flush()
+            self.addCleanup(running.lock_file.close)
+            for _ in range(2):
+                total = collect()['counters']['feed_cache_total']
+                self.assertEqual(total[label], 3)
+                self.assertEqual(total['result="hit",view="x"'], 1)
+        files = os.listdir(directory)
+        self.assertNotIn('1-1.json', files)
+        self.assertIn(f'{running.name}.json', files)
+
+    def test_process_files_are_unique(self):
+        """Процессы с одним pid пишут в разные файлы."""
+        first, second = Registry(), Registry()
+        with override_settings(METRICS_DIR=tempfile.mkdtemp(
+            dir=settings.BASE_DIR
+        )):
+            self.addCleanup(shutil.rmtree, settings.METRICS_DIR)
+            for registry in (first, second):
+                registry.flush()
+                self.addCleanup(registry.lock_file.close)
+        self.assertNotEqual(first.name, second.name)
+        self.assertTrue(first.name.startswith(f'{os.getpid()}-'))
+
+    def test_metrics_are_hidden_from_outside(self):
+        """Снаружи /metrics недоступен."""
+        response = Client(REMOTE_ADDR='10.0.0.1').get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+
+
+class TieredCacheTests(SimpleTestCase):
+    """Два экземпляра TieredCache над одним каталогом ведут себя
+    как кэши двух процессов.
+    """
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.first = self.make_worker()
+        self.second = self.make_worker()
+
+    def make_worker(self):
+        worker = TieredCache('shared', {'OPTIONS': {
+            'MAX_ENTRIES': 2,
+            'LOCAL_TIMEOUT': 60,
+            'SHARED_PREFIXES': ['version:'],
+        }})
+        worker.shared = SharedFileCache(self.location, {})
+        return worker
+
+    def test_values_are_shared_between_workers(self):
+        """Запись одного процесса видна другому."""
+        self.first.set('page', 'страница')
+        self.assertEqual(self.second.get('page'), 'страница')
+        self.assertEqual(self.second.get_many(['page', 'missing']), {
+            'page': 'страница',
+        })
+
+    def test_versions_bypass_local_cache(self):
+        """Смена версии сразу видна всем процессам, а обычная запись
+        остаётся в локальном кэше до истечения LOCAL_TIMEOUT.
+        """
+        self.first.set('version:index', 'old')
+        self.first.set('page', 'old')
+        self.second.get('version:index')
+        self.second.get('page')
+        self.first.set('version:index', 'new')
+        self.first.set('page', 'new')
+        self.assertEqual(self.second.get('version:index'), 'new')
+        self.assertEqual(self.second.get('page'), 'old')
+        key = self.second.make_key('page')
+        _, data = self.second.local[key]
+        self.second.local[key] = (time.monotonic() - 1, data)
+        self.assertEqual(self.second.get('page'), 'new')
+
+    def test_local_cache_is_lru_and_isolated(self):
+        """Локальный кэш вытесняет давние записи и отдаёт копии."""
+        for key in ('a', 'b', 'c'):
+            self.first.set(key, [key])
+        self.assertEqual(len(self.first.local), 2)
+        self.assertNotIn(self.first.make_key('a'), self.first.local)
+        self.first.get('b').append('изменено')
+        self.assertEqual(self.first.get('b'), ['b'])
+
+    def test_add_is_exclusive(self):
+        """add удаётся одному процессу, пока запись не истекла."""
+        self.assertTrue(self.first.add('version:lock', 1, timeout=1))
+        self.assertFalse(self.second.add('version:lock', 2))
+        self.assertEqual(self.second.get('version:lock'), 1)
+        self.first.shared.set('version:lock', 1, timeout=-1)
+        self.assertTrue(self.second.add('version:lock', 2))
+
+
+class IdentityMapTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Тестовый пост'
+        )
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+
+    def test_repeated_lookups_hit_the_map(self):
+        """Повторный поиск по полю или pk не ходит в базу."""
+        group = load_object_or_404(
+            self.request, Group.objects, slug='test_slug'
+        )
+        with self.assertNumQueries(0):
+            self.assertIs(load_object_or_404(
+                self.request, Group.objects, slug='test_slug'
+            ), group)
+            self.assertIs(load_object_or_404(
+                self.request, Group.objects, id=group.pk
+            ), group)
+
+    def test_select_related_objects_are_remembered(self):
+        """Связанные через select_related объекты тоже в карте."""
+        post = load_object_or_404(
+            self.request,
+            Post.objects.select_related('author', 'group'),
+            pk=IdentityMapTests.post.pk,
+        )
+        with self.assertNumQueries(0):
+            self.assertIs(load_object_or_404(
+                self.request, User.objects, pk=IdentityMapTests.user.pk
+            ), post.author)
+
+    def test_map_is_per_request(self):
+        """У другого запроса своя карта; отсутствие объекта — 404."""
+        load_object_or_404(self.request, Group.objects, slug='test_slug')
+        other = RequestFactory().get('/')
+        self.assertIsNone(identity_map(other).find(Group, slug='test_slug'))
+        with self.assertRaises(Http404):
+            load_object_or_404(other, Group.objects, slug='missing')
+
+
+class CachedAuthenticationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='reader', password='old-Passw0rd'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('about:author')
+        self.client = Client()
+        self.client.force_login(CachedAuthenticationTests.user)
+
+    def test_warm_cache_needs_no_queries(self):
+        """При тёплом кэше сессия и пользователь не читаются из базы."""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Пользователь: reader')
+
+    def test_saved_user_is_reloaded(self):
+        """После сохранения пользователь читается заново."""
+        self.client.get(self.url)
+        user = User.objects.get(pk=CachedAuthenticationTests.user.pk)
+        user.username = 'renamed'
+        user.save()
+        self.assertIsNone(cache.get(USER_KEY.format(user.pk)))
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Пользователь: renamed')
+
+    def test_password_change_logs_out_other_sessions(self):
+        """Смена пароля завершает остальные сессии, но не текущую."""
+        other = Client()
+        other.force_login(CachedAuthenticationTests.user)
+        other.get(self.url)
+        self.client.post(reverse('users:password_change'), {
+            'old_password': 'old-Passw0rd',
+            'new_password1': 'new-Passw0rd',
+            'new_password2': 'new-Passw0rd',
+        })
+        self.assertContains(self.client.get(self.url), 'Пользователь: reader')
+        self.assertContains(other.get(self.url), 'Войти')
+
+    def test_logout_forgets_user(self):
+        """Выход убирает пользователя из кэша."""
+        self.client.get(self.url)
+        self.client.get(reverse('users:logout'))
+        self.assertIsNone(
+            cache.get(USER_KEY.format(CachedAuthenticationTests.user.pk))
+        )
+        self.assertContains(self.client.get(self.url), 'Войти')
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def route(self, request, write=False):
+        """Куда middleware направит чтение постов и сессий в запросе."""
+        routes = {}
+
+        def view(request):
+            if write:
+                router.db_for_write(Post)
+            routes['post'] = router.db_for_read(Post)
+            routes['session'] = router.db_for_read(Session)
+            with primary():
+                routes['primary'] = router.db_for_read(Post)
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        routes['pinned'] = PIN_COOKIE in response.cookies
+        return routes
+
+    def test_get_reads_from_replica(self):
+        """GET читает посты с реплики, сессии — с основной базы."""
+        routes = self.route(RequestFactory().get('/'))
+        self.assertEqual(routes['post'], 'replica')
+        self.assertEqual(routes['session'], 'default')
+        self.assertEqual(routes['primary'], 'default')
+        self.assertFalse(routes['pinned'])
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_writes_pin_reads_to_primary(self):
+        """После записи запрос и следующие за ним читают основную базу."""
+        factory = RequestFactory()
+        self.assertEqual(self.route(factory.post('/'))['post'], 'default')
+        routes = self.route(factory.get('/'), write=True)
+        self.assertEqual(routes['post'], 'default')
+        self.assertTrue(routes['pinned'])
+        pinned = factory.get('/')
+        pinned.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.route(pinned)['post'], 'default')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_everything_reads_primary(self):
+        routes = self.route(RequestFactory().get('/'))
+        self.assertEqual(routes['post'], 'default')
+
+    def test_comment_pins_author(self):
+        """Автор комментария получает куку чтения с основной базы."""
+        client = Client()
+        client.force_login(ReplicaRoutingTests.user)
+        response = client.post(
+            reverse(
+                'posts:add_comment',
+                kwargs={'post_id': ReplicaRoutingTests.post.pk}
+            ),
+            {'text': 'Комментарий'},
+        )
+        self.assertEqual(
+            response.cookies[PIN_COOKIE]['max-age'],
+            settings.REPLICA_PIN_SECONDS,
+        )
+
+    def test_copy_database(self):
+        """Реплика получает снимок основной базы вместе со схемой."""
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, 'primary.sqlite3')
+        target = os.path.join(directory, 'replica.sqlite3')
+        with sqlite3.connect(source) as db:
+            db.execute('CREATE TABLE post (text TEXT)')
+            db.execute("INSERT INTO post VALUES ('Тестовый пост')")
+        db.close()
+        copy_database(source, target)
+        db = sqlite3.connect(target)
+        self.addCleanup(db.close)
+        self.assertEqual(
+            db.execute('SELECT text FROM post').fetchall(),
+            [('Тестовый пост',)],
+        )
+
+
+class SqliteTests(TestCase):
+    def test_connections_get_pragmas(self):
+        """Новое соединение получает прагмы из SQLITE_PRAGMAS."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout']
+            )
+            cursor.execute('PRAGMA synchronous')
+            # 1 — NORMAL.
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    @override_settings(SQLITE_WRITE_BACKOFF=0, SQLITE_WRITE_RETRIES=2)
+    def test_locked_writes_are_retried(self):
+        """Запись, упёршаяся в блокировку, повторяется, но не бесконечно."""
+        queue = WriteQueue()
+        attempts = []
+
+        def write(failures):
+            attempts.append(failures)
+            if len(attempts) <= failures:
+                raise OperationalError('database is locked')
+            return Post.objects.create(
+                author=User.objects.create_user(username=f'user{failures}'),
+                text='Тестовый пост',
+            )
+
+        post = queue.run(write, 2)
+        self.assertEqual(len(attempts), 3)
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+        attempts.clear()
+        with self.assertRaises(OperationalError):
+            queue.run(write, 3)
+        self.assertEqual(len(attempts), 3)
+
+    def test_other_errors_are_not_retried(self):
+        queue = WriteQueue()
+        attempts = []
+
+        def write():
+            attempts.append(True)
+            raise OperationalError('no such table: posts_post')
+
+        with self.assertRaises(OperationalError):
+            queue.run(write)
+        self.assertEqual(len(attempts), 1)
+
+    def test_get_views_that_write_can_join_queue(self):
+        """GET идёт в очередь, только если view пишет по ссылке."""
+        def view(request):
+            return HttpResponse(getattr(write_queue.local, 'depth', 0))
+
+        factory = RequestFactory()
+        cases = (
+            (single_writer(view), factory.get('/'), b'0'),
+            (single_writer(view), factory.post('/'), b'1'),
+            (single_writer(always=True)(view), factory.get('/'), b'1'),
+        )
+        for wrapped, request, depth in cases:
+            with self.subTest(method=request.method, depth=depth):
+                self.assertEqual(wrapped(request).content, depth)
+
+    def test_nested_writes_share_turn(self):
+        """Запись внутри записи того же потока не ждёт саму себя."""
+        queue = WriteQueue()
+        self.assertEqual(queue.run(queue.run, lambda: 'готово'), 'готово')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, SQLITE_WRITE_BACKOFF=0, SQLITE_WRITE_RETRIES=1
+)
+class WriteQueueRollbackTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_failed_write_keeps_replaced_image(self):
+        """Откаченная запись не удаляет картинку, на которую пост
+        по-прежнему ссылается.
+        """
+        user = User.objects.create_user(username='username')
+        post = Post.objects.create(
+            author=user, text='Пост', image=ContentFile(CONTENT, 'a.gif')
+        )
+        old_name = post.image.name
+
+        def replace_image():
+            post.image = ContentFile(b'GIF89a-other', 'b.gif')
+            post.save()
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            WriteQueue().run(replace_image)
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, old_name)
+        self.assertTrue(post.image.storage.exists(old_name))
+        self.assertEqual(StoredFile.objects.get(name=old_name).references, 1)
@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from .metrics import collect, render_prometheus
+
 
 def page_not_found(request, exception):
     template = 'core/404.html'
@@ -17,3 +21,17 @@ def csrf_failure(request, reason=''):
 def server_error(request):
     template = 'core/500.html'
     return render(request, template, status=500)
+
+
+def metrics(request):
+    """Метрики всех процессов в формате Prometheus."""
+    allowed = (
+        request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+        or request.user.is_staff
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(
+        render_prometheus(collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,198 @@
+import random
+import time
+from functools import partial, wraps
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.cache import (get_cache_key, has_vary_header,
+                                learn_cache_key, patch_cache_control)
+
+from core.holes import fill_holes
+from core.identity import clear_identity_map
+from core.metrics import registry
+from core.routers import primary, reading_replica
+from yatube.settings import (FEED_CACHE_JITTER, FEED_CACHE_TIMEOUT,
+                             FEED_LOCK_TIMEOUT, FEED_STALE_TIMEOUT)
+
+VERSION_KEY = 'feed_version:{}'
+FEED_KEY_PREFIX = 'feed'
+LOCK_KEY = 'feed_lock:{}'
+
+HIT = 'hit'
+MISS = 'miss'
+STALE = 'stale'
+
+INDEX_SCOPE = 'index'
+GROUP_SCOPE = 'group:{slug}'
+PROFILE_SCOPE = 'profile:{username}'
+# Версия, общая для всех лент: меняется при правке групп
+# и при массовых изменениях вроде переноса картинок.
+SHARED_SCOPE = 'shared'
+# Версии боковых блоков, которые рисуются дырками: страницы по ним
+# не кэшируются, но они входят в ETag, чтобы 304 не оставил у клиента
+# устаревший блок.
+TRENDING_SCOPE = 'trending'
+RECOMMENDATIONS_SCOPE = 'recommendations'
+
+
+def post_scopes(post):
+    """Области кэша лент, на которых виден пост."""
+    scopes = [
+        INDEX_SCOPE,
+        PROFILE_SCOPE.format(username=post.author.username),
+    ]
+    if post.group is not None:
+        scopes.append(GROUP_SCOPE.format(slug=post.group.slug))
+    return scopes
+
+
+def get_versions(scopes):
+    """Возвращает текущие версии областей, заводя недостающие."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: uuid4().hex for key in keys if key not in versions}
+    for key, version in missing.items():
+        cache.add(key, version, timeout=None)
+    if missing:
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def invalidate(*scopes):
+    """Меняет версии областей, после чего старые страницы не читаются.
+
+    Внутри транзакции версии меняются ещё раз после коммита: страница,
+    собранная до него по старым данным, не должна остаться с новой.
+    """
+    bump_versions(scopes)
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(bump_versions, scopes))
+
+
+def bump_versions(scopes):
+    cache.set_many(
+        {VERSION_KEY.format(scope): uuid4().hex for scope in scopes},
+        timeout=None,
+    )
+
+
+def cache_feed(*scope_templates, timeout=FEED_CACHE_TIMEOUT):
+    """Кэширует страницу ленты, пока не изменится версия её областей
+    и не истечёт срок свежести.
+
+    Шаблоны областей заполняются именованными аргументами view,
+    например `cache_feed(GROUP_SCOPE)`. Устаревшую страницу пересобирает
+    один запрос, взявший блокировку в кэше, а остальные в это время
+    получают старую копию.
+
+    Страница собирается одна на всех: фрагменты `{% hole %}`, зависящие
+    от пользователя, подставляются в неё при каждом ответе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            return revalidate(serve(request, args, kwargs))
+
+        def serve(request, args, kwargs):
+            scopes = [
+                template.format(**kwargs) for template in scope_templates
+            ]
+            versions = get_versions(scopes + [SHARED_SCOPE])
+            key = get_cache_key(request, FEED_KEY_PREFIX, 'GET', cache=cache)
+            entry = cache.get(key) if key is not None else None
+            if entry is None:
+                count(request, MISS)
+                response = render_shared(view, request, args, kwargs)
+                return fill_holes(
+                    request, store(request, response, versions, timeout)
+                )
+            cached_versions, fresh_until, cached_response = entry
+            if cached_versions == versions and time.time() < fresh_until:
+                count(request, HIT)
+                return fill_holes(request, cached_response)
+            lock_key = LOCK_KEY.format(key)
+            if not cache.add(lock_key, True, FEED_LOCK_TIMEOUT):
+                count(request, STALE)
+                return fill_holes(request, cached_response)
+            count(request, MISS)
+            try:
+                response = render_shared(view, request, args, kwargs)
+                return fill_holes(
+                    request, store(request, response, versions, timeout)
+                )
+            finally:
+                cache.delete(lock_key)
+        return wrapper
+    return decorator
+
+
+def revalidate(response):
+    """Клиент не хранит ленту без проверки: каждый раз спрашивает
+    сервер и получает 304 по ETag или Last-Modified, если она та же.
+
+    Страница меняется по сигналам, а не по сроку, поэтому обещать
+    клиенту свежесть на какое-то время нельзя.
+    """
+    if 'Expires' in response:
+        del response['Expires']
+    patch_cache_control(response, private=True, no_cache=True, max_age=0)
+    return response
+
+
+def render_shared(view, request, args, kwargs):
+    """Собирает страницу с метками вместо пользовательских фрагментов.
+
+    Данные берутся с основной базы: страница ляжет в кэш с текущими
+    версиями областей, и отстающая реплика закрепила бы в нём старую.
+    Объекты, которые проверка условного GET уже загрузила в карту
+    запроса с реплики, забываются по той же причине.
+    """
+    if reading_replica():
+        clear_identity_map(request)
+    request.punch_holes = True
+    try:
+        with primary():
+            return view(request, *args, **kwargs)
+    finally:
+        request.punch_holes = False
+
+
+def store(request, response, versions, timeout):
+    """Кладёт ответ в кэш вместе с версиями и сроком свежести.
+
+    Срок сокращается на случайную долю до `FEED_CACHE_JITTER`, чтобы
+    страницы, собранные разом, не устаревали одновременно. Сама запись
+    живёт ещё `FEED_STALE_TIMEOUT` секунд как устаревшая копия. Этот
+    срок — только для кэша сервера, клиенту он не сообщается.
+    """
+    if response.streaming or response.status_code != 200:
+        return response
+    # Как и cache_page, не кэшируем ответ, выдающий куку новому клиенту.
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return response
+    if 'private' in response.get('Cache-Control', ''):
+        return response
+    lifetime = timeout + FEED_STALE_TIMEOUT
+    key = learn_cache_key(
+        request, response, lifetime, FEED_KEY_PREFIX, cache=cache
+    )
+    fresh_until = time.time() + timeout * (
+        1 - random.random() * FEED_CACHE_JITTER
+    )
+    cache.set(key, (versions, fresh_until, response), lifetime)
+    return response
+
+
+def count(request, result):
+    # По отметке conditional узнаёт, что ответ — устаревшая копия.
+    request.feed_cache = result
+    match = request.resolver_match
+    registry.increment(
+        'feed_cache_total',
+        view=match.view_name if match is not None else 'unresolved',
+        result=result,
+    )
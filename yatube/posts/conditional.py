@@ -0,0 +1,155 @@
+from functools import wraps
+from hashlib import md5
+
+from django.contrib.auth import get_user_model
+from django.db.models import Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from core.identity import identity_map
+
+from . import follow_graph
+from .caching import (INDEX_SCOPE, RECOMMENDATIONS_SCOPE, STALE,
+                      TRENDING_SCOPE, get_versions)
+from .counters import get_user_stats
+from .models import Group, Post
+
+User = get_user_model()
+
+
+def conditional(state):
+    """Отвечает 304, если у клиента текущая версия страницы.
+
+    `state(request, **kwargs)` одним запросом возвращает время последней
+    правки и значения, от которых зависит страница, или None, если
+    объекта нет. Из них строятся слабый ETag и, если время не None,
+    Last-Modified; при совпадении view не вызывается вовсе. Пользователь
+    входит в ETag, потому что фрагменты `{% hole %}` у каждого свои;
+    версии боковых блоков из дырок добавляет сам state.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            current = state(request, **kwargs)
+            if current is None:
+                return view(request, *args, **kwargs)
+            last_modified, values = current
+            etag = make_etag(request, last_modified, values)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            # Устаревшая копия из кэша старше посчитанных валидаторов.
+            if (response.status_code != 200
+                    or getattr(request, 'feed_cache', None) == STALE):
+                return response
+            if last_modified is not None:
+                response.setdefault('Last-Modified', http_date(last_modified))
+            response.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def make_etag(request, last_modified, values):
+    data = repr((request.user.pk, last_modified, *values)).encode()
+    return 'W/' + quote_etag(md5(data).hexdigest())
+
+
+def timestamp(value):
+    return value.timestamp() if value is not None else None
+
+
+def last_updated(field):
+    """Подзапрос со временем последней правки постов по полю field."""
+    return Subquery(
+        Post.objects.filter(**{field: OuterRef('pk')})
+        .order_by('-updated')
+        .values('updated')[:1]
+    )
+
+
+def load(request, queryset, **lookup):
+    """Загружает объект для view заранее, через карту объектов запроса."""
+    try:
+        return identity_map(request).get(queryset, **lookup)
+    except queryset.model.DoesNotExist:
+        return None
+
+
+def recommendations_versions(request):
+    """От чего зависит блок «Кого почитать»: пересчёт рекомендаций
+    и подписки самого читателя, которые из блока исключаются.
+    """
+    if not request.user.is_authenticated:
+        return ()
+    return (
+        *get_versions([RECOMMENDATIONS_SCOPE]),
+        follow_graph.get_version(request.user.pk),
+    )
+
+
+def index_state(request):
+    """Лентам — только ETag.
+
+    Удаление поста не сдвигает время последней правки, и клиент,
+    приславший один If-Modified-Since, получил бы 304 со старой лентой.
+    Время входит в ETag вместе с тем, что меняет удаление: здесь это
+    версия области, у группы и автора — число постов.
+    """
+    last_modified = Post.objects.aggregate(Max('updated'))['updated__max']
+    return None, (
+        timestamp(last_modified),
+        get_versions([INDEX_SCOPE, TRENDING_SCOPE]),
+        recommendations_versions(request),
+    )
+
+
+def group_state(request, slug):
+    group = load(
+        request,
+        Group.objects.annotate(last_modified=last_updated('group')),
+        slug=slug,
+    )
+    if group is None:
+        return None
+    return None, (
+        timestamp(group.last_modified),
+        group.title, group.description, group.post_count,
+        get_versions([TRENDING_SCOPE]),
+    )
+
+
+def profile_state(request, username):
+    users = User.objects.select_related('stats').annotate(
+        last_modified=last_updated('author')
+    )
+    user = load(request, users, username=username)
+    if user is None:
+        return None
+    stats = get_user_stats(user)
+    followed = request.user.is_authenticated and follow_graph.is_following(
+        request.user.pk, user.pk
+    )
+    return None, (
+        timestamp(user.last_modified), user.first_name, user.last_name,
+        stats.post_count, stats.follower_count, stats.following_count,
+        followed, recommendations_versions(request),
+    )
+
+
+def post_state(request, post_id):
+    post = load(
+        request,
+        Post.objects.select_related('author__stats', 'group'),
+        id=post_id,
+    )
+    if post is None:
+        return None
+    return timestamp(post.updated), (
+        get_user_stats(post.author).post_count,
+    )
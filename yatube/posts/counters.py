@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from yatube.settings import COUNT_CACHE_TIMEOUT
+
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+def _count(queryset, field):
+    """Подзапрос с числом записей queryset для строки по полю field."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def change_counter(model, pk, field, delta, touch=False):
+    """Атомарно меняет счётчик на delta средствами F().
+
+    Счётчик не уходит ниже нуля, даже если успел разойтись с данными.
+    С touch=True заодно обновляет время изменения записи `updated`.
+    """
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{field + '__gte': -delta})
+    updates = {field: F(field) + delta}
+    if touch:
+        updates['updated'] = timezone.now()
+    return queryset.update(**updates)
+
+
+def rebuild_user_counters(user_ids):
+    users = User.objects.filter(pk__in=user_ids).annotate(
+        posts_total=_count(Post.objects, 'author'),
+        followers_total=_count(Follow.objects, 'author'),
+        following_total=_count(Follow.objects, 'user'),
+    )
+    for user in users:
+        UserStats.objects.update_or_create(
+            user=user,
+            defaults={
+                'post_count': user.posts_total,
+                'follower_count': user.followers_total,
+                'following_count': user.following_total,
+            },
+        )
+
+
+def rebuild_group_counters(group_ids):
+    Group.objects.filter(pk__in=group_ids).update(
+        post_count=_count(Post.objects, 'group')
+    )
+
+
+def rebuild_post_counters(post_ids):
+    # Трогаем только разошедшиеся посты, чтобы не сбросить кэш
+    # карточек всех остальных.
+    drifted = list(
+        Post.objects.filter(pk__in=post_ids)
+        .annotate(actual=_count(Comment.objects, 'post'))
+        .exclude(comment_count=F('actual'))
+        .values_list('pk', flat=True)
+    )
+    Post.objects.filter(pk__in=drifted).update(
+        comment_count=_count(Comment.objects, 'post'),
+        updated=timezone.now(),
+    )
+
+
+def estimate_count(key, queryset):
+    """Число записей для лент без счётчика; COUNT раз в
+    `COUNT_CACHE_TIMEOUT` секунд, между ними — оценка из кэша.
+    """
+    return cache.get_or_set(
+        'count:' + key, queryset.count, COUNT_CACHE_TIMEOUT
+    )
+
+
+def get_user_stats(user):
+    """Счётчики пользователя; пересчитывает их, если записи ещё нет."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        rebuild_user_counters([user.pk])
+        return UserStats.objects.get(user=user)
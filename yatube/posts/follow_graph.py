@@ -0,0 +1,83 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from yatube.settings import FOLLOW_GRAPH_LOCAL_SIZE, FOLLOW_GRAPH_TIMEOUT
+
+from .models import Follow
+
+# Версия подписок пользователя и снимок (версия, массив) — только
+# в общем кэше, см. SHARED_PREFIXES.
+VERSION_KEY = 'follow_graph:version:{}'
+FOLLOWEES_KEY = 'follow_graph:followees:{}'
+# Идентификаторы AutoField помещаются в 32 бита.
+TYPECODE = 'i'
+
+# Массивы, уже загруженные процессом: id пользователя → (версия, массив).
+local = OrderedDict()
+lock = threading.Lock()
+
+
+def get_version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def followees(user_id):
+    """Отсортированные id авторов, на которых подписан пользователь.
+
+    Массив берётся из памяти процесса, пока совпадает его версия в общем
+    кэше: проверка стоит одного чтения короткого ключа. Иначе он
+    читается из снимка в общем кэше, с которым новые процессы стартуют
+    прогретыми, или, если и снимок устарел, из базы.
+    """
+    version = get_version(user_id)
+    with lock:
+        entry = local.get(user_id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    key = FOLLOWEES_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is None or entry[0] != version:
+        entry = (version, array(
+            TYPECODE,
+            Follow.objects.filter(user_id=user_id).values_list(
+                'author_id', flat=True
+            ).order_by('author_id'),
+        ))
+        # Снимок, собранный до смены версии, уже никто не примет.
+        cache.set(key, entry, FOLLOW_GRAPH_TIMEOUT)
+    with lock:
+        local[user_id] = entry
+        local.move_to_end(user_id)
+        while len(local) > FOLLOW_GRAPH_LOCAL_SIZE:
+            local.popitem(last=False)
+    return entry[1]
+
+
+def is_following(user_id, author_id):
+    ids = followees(user_id)
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def refresh(user_id):
+    """Перечитывает массив после подписки или отписки."""
+    forget([user_id])
+    followees(user_id)
+
+
+def forget(user_ids):
+    """Меняет версии: массивы в памяти процессов и снимки устаревают."""
+    cache.set_many(
+        {VERSION_KEY.format(user_id): uuid4().hex for user_id in user_ids},
+        timeout=None,
+    )
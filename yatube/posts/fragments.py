@@ -0,0 +1,78 @@
+import hashlib
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+
+from yatube.settings import FRAGMENT_CACHE_TIMEOUT
+
+from .models import Post
+
+CARD_TEMPLATE = 'posts/includes/single_post.html'
+CARD_KEY = 'post_card:{id}:{updated}:{variant}:{version}'
+BODY_TEMPLATE = 'posts/includes/post_body.html'
+BODY_KEY = 'post_body:{id}:{updated}:{post_amount}:{version}'
+
+
+@lru_cache(maxsize=None)
+def template_version(template_name):
+    """Хэш исходника шаблона: после его правки у карточек новые ключи."""
+    source = get_template(template_name).template.source
+    return hashlib.md5(source.encode()).hexdigest()[:8]
+
+
+def card_key(post, variant):
+    return CARD_KEY.format(
+        id=post.pk,
+        updated=post.updated.timestamp(),
+        variant=variant,
+        version=template_version(CARD_TEMPLATE),
+    )
+
+
+def render_cards(posts, show_group=False):
+    """HTML карточек постов в исходном порядке.
+
+    Готовые карточки берутся из кэша одним get_many, недостающие
+    рисуются и кладутся туда одним set_many.
+    """
+    variant = 'group' if show_group else 'plain'
+    keys = [(card_key(post, variant), post) for post in posts]
+    cards = cache.get_many([key for key, _ in keys])
+    missing = {
+        key: render_to_string(
+            CARD_TEMPLATE, {'post': post, 'show_group': show_group}
+        )
+        for key, post in keys
+        if key not in cards
+    }
+    if missing:
+        cache.set_many(missing, FRAGMENT_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [cards[key] for key, _ in keys]
+
+
+def render_post_body(post, post_amount):
+    """HTML поста на его странице, отдельно от ленты комментариев.
+
+    Кроме правок поста, ключ меняется вместе с числом постов автора.
+    """
+    key = BODY_KEY.format(
+        id=post.pk,
+        updated=post.updated.timestamp(),
+        post_amount=post_amount,
+        version=template_version(BODY_TEMPLATE),
+    )
+    return cache.get_or_set(
+        key,
+        lambda: render_to_string(
+            BODY_TEMPLATE, {'post': post, 'post_amount': post_amount}
+        ),
+        FRAGMENT_CACHE_TIMEOUT,
+    )
+
+
+def touch_posts(**filters):
+    """Меняет `updated` у постов, после чего их карточки рисуются заново."""
+    return Post.objects.filter(**filters).update(updated=timezone.now())
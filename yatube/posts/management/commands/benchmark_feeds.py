@@ -0,0 +1,198 @@
+import json
+import math
+import re
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, UserStats
+
+User = get_user_model()
+
+NEXT_CURSOR = re.compile(r'href="\?cursor=([^"]+)">\s*Следующая')
+PERCENTILES = (50, 95, 99)
+# Адрес вне INTERNAL_IPS, чтобы debug toolbar не попадал в замеры.
+REMOTE_ADDR = '192.0.2.1'
+
+
+def percentile(values, percent):
+    """Процентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку и число SQL-запросов страниц лент '
+            'на разной глубине и сравнивает с сохранённым baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=20,
+            help='Сколько раз запрашивать каждую страницу.',
+        )
+        parser.add_argument(
+            '--depths',
+            default='1,3,10',
+            help='Номера страниц через запятую.',
+        )
+        parser.add_argument(
+            '--warm',
+            action='store_true',
+            help='Не сбрасывать кэш перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Куда сохранить результаты в JSON.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON с прошлым замером для сравнения.',
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=None,
+            help=('Допустимый рост p95 в процентах; при большем росте '
+                  'или росте числа запросов команда падает.'),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            depths = sorted({int(depth) for depth in options['depths'].split(
+                ','
+            )})
+        except ValueError:
+            raise CommandError('--depths: ожидаются целые числа')
+        if settings.DEBUG:
+            self.stderr.write(
+                'DEBUG включён: запросы логируются, замеры будут завышены.'
+            )
+        results = {}
+        for name, client, url in self.targets():
+            for depth, page_url in zip(depths, self.walk(client, url, depths)):
+                results[f'{name}@{depth}'] = self.measure(
+                    client, page_url, options['requests'], options['warm']
+                )
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            self.compare(results, baseline, options['max_regression'])
+
+    def targets(self):
+        """Самые тяжёлые страницы каждого вида из текущей базы."""
+        anonymous = Client(REMOTE_ADDR=REMOTE_ADDR)
+        targets = [('index', anonymous, reverse('posts:index'))]
+        group = Group.objects.order_by('-post_count').first()
+        if group is not None:
+            targets.append(('group_posts', anonymous, reverse(
+                'posts:group_list', kwargs={'slug': group.slug}
+            )))
+        stats = UserStats.objects.select_related('user')
+        author = stats.order_by('-post_count').first()
+        if author is not None:
+            targets.append(('profile', anonymous, reverse(
+                'posts:profile', kwargs={'username': author.user.username}
+            )))
+        post = Post.objects.order_by('-comment_count').first()
+        if post is not None:
+            targets.append(('post_detail', anonymous, reverse(
+                'posts:post_detail', kwargs={'post_id': post.pk}
+            )))
+        reader = stats.order_by('-following_count').first()
+        if reader is not None:
+            client = Client(REMOTE_ADDR=REMOTE_ADDR)
+            client.force_login(reader.user)
+            targets.append(
+                ('follow_index', client, reverse('posts:follow_index'))
+            )
+        if len(targets) < 5:
+            self.stderr.write(
+                'В базе мало данных, часть страниц пропущена; '
+                'запустите seed_data.'
+            )
+        return targets
+
+    def walk(self, client, url, depths):
+        """Адреса страниц нужной глубины — по курсорам «Следующая».
+
+        Если лента короче, глубины дальше её конца пропускаются.
+        """
+        page_url, number = url, 1
+        for depth in depths:
+            while number < depth:
+                cache.clear()
+                content = client.get(page_url).content.decode()
+                match = NEXT_CURSOR.search(content)
+                if match is None:
+                    return
+                page_url, number = f'{url}?cursor={match.group(1)}', number + 1
+            yield page_url
+
+    def measure(self, client, url, requests, warm):
+        timings, queries = [], []
+        for _ in range(requests):
+            if not warm:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+            queries.append(len(context.captured_queries))
+        result = {
+            f'p{percent}_ms': round(percentile(timings, percent) * 1000, 3)
+            for percent in PERCENTILES
+        }
+        result['queries'] = max(queries)
+        return result
+
+    def report(self, results):
+        header = f'{"страница":<20}' + ''.join(
+            f'{f"p{percent}, мс":>12}' for percent in PERCENTILES
+        ) + f'{"запросов":>10}'
+        self.stdout.write(header)
+        for name, result in results.items():
+            self.stdout.write(f'{name:<20}' + ''.join(
+                f'{result[f"p{percent}_ms"]:>12.2f}'
+                for percent in PERCENTILES
+            ) + f'{result["queries"]:>10}')
+
+    def compare(self, results, baseline, max_regression):
+        regressions = []
+        self.stdout.write('\nСравнение с baseline (p95, запросы):')
+        for name, result in results.items():
+            old = baseline.get(name)
+            if old is None:
+                continue
+            change = (
+                (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+                if old['p95_ms'] else 0
+            )
+            self.stdout.write(
+                f'{name:<20}{change:>+10.1f}%'
+                f'{old["queries"]:>6} -> {result["queries"]}'
+            )
+            if max_regression is None:
+                continue
+            if (change > max_regression
+                    or result['queries'] > old['queries']):
+                regressions.append(name)
+        if regressions:
+            raise CommandError(
+                'Регрессия: ' + ', '.join(regressions)
+            )
@@ -0,0 +1,114 @@
+import json
+import logging
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.management.commands.benchmark_feeds import (PERCENTILES,
+                                                       REMOTE_ADDR,
+                                                       percentile)
+from posts.models import Post
+
+User = get_user_model()
+
+USERNAME = 'write_benchmark'
+
+
+def write_comments(task):
+    """Процесс-писатель: комментирует пост и замеряет каждую запись."""
+    post_id, user_id, writes, serialize = task
+    settings.SQLITE_SERIALIZE_WRITES = serialize
+    # Ошибки блокировки считаются, а не печатаются трейсбеком на каждую.
+    logging.getLogger('django.request').disabled = True
+    client = Client(REMOTE_ADDR=REMOTE_ADDR)
+    client.force_login(User.objects.get(pk=user_id))
+    url = reverse('posts:add_comment', kwargs={'post_id': post_id})
+    timings, locked, failed = [], 0, 0
+    for number in range(writes):
+        start = time.perf_counter()
+        try:
+            response = client.post(url, {'text': f'Комментарий {number}'})
+        except OperationalError:
+            locked += 1
+            continue
+        if response.status_code != 302:
+            failed += 1
+            continue
+        timings.append(time.perf_counter() - start)
+    connections.close_all()
+    return timings, locked, failed
+
+
+class Command(BaseCommand):
+    help = ('Замеряет запись комментариев из нескольких процессов сразу '
+            'и считает ошибки `database is locked`.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Сколько процессов пишут одновременно.',
+        )
+        parser.add_argument(
+            '--writes',
+            type=int,
+            default=50,
+            help='Сколько комментариев пишет каждый процесс.',
+        )
+        parser.add_argument(
+            '--no-queue',
+            action='store_true',
+            help='Писать в обход очереди писателей, для сравнения.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Куда сохранить результаты в JSON.',
+        )
+
+    def handle(self, *args, **options):
+        name = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        if 'memory' in str(name):
+            raise CommandError('Нужна база SQLite в файле, а не в памяти.')
+        user, _ = User.objects.get_or_create(username=USERNAME)
+        post = Post.objects.create(author=user, text='Замер записи')
+        # Дочерние процессы открывают свои соединения.
+        connections.close_all()
+        tasks = [
+            (post.pk, user.pk, options['writes'], not options['no_queue'])
+        ] * options['workers']
+        start = time.perf_counter()
+        try:
+            with multiprocessing.get_context('fork').Pool(
+                options['workers']
+            ) as pool:
+                results = pool.map(write_comments, tasks)
+        finally:
+            elapsed = time.perf_counter() - start
+            user.delete()
+        timings = [timing for result, _, _ in results for timing in result]
+        result = {
+            'workers': options['workers'],
+            'writes': len(timings),
+            'locked': sum(locked for _, locked, _ in results),
+            'failed': sum(failed for _, _, failed in results),
+            'writes_per_second': round(len(timings) / elapsed, 1),
+        }
+        if timings:
+            result.update({
+                f'p{percent}_ms': round(
+                    percentile(timings, percent) * 1000, 3
+                )
+                for percent in PERCENTILES
+            })
+        for key, value in result.items():
+            self.stdout.write(f'{key:<20}{value:>12}')
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(result, file, indent=2, sort_keys=True)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.recommendations import build
+from yatube.settings import RECOMMENDATION_TOP_K
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации «Кого почитать» по графу подписок: '
+            'подписки друзей и подписки похожих читателей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=RECOMMENDATION_TOP_K,
+            help='Сколько кандидатов сохранять для каждого пользователя.',
+        )
+
+    def handle(self, *args, **options):
+        total = build(options['top'])
+        self.stdout.write(f'Сохранено рекомендаций: {total}')
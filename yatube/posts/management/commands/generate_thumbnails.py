@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Делает миниатюры для постов с картинкой, у которых их ещё '
+            'нет: старых постов и постов из seed_data.')
+
+    def handle(self, *args, **options):
+        count = thumbnails.backfill()
+        thumbnails.wait()
+        self.stdout.write(f'Обработано постов с картинкой: {count}')
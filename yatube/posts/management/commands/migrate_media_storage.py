@@ -0,0 +1,62 @@
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.caching import SHARED_SCOPE, invalidate
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище по хэшу содержимого '
+            'и переписывает пути в Post.image.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько постов читать за один запрос.',
+        )
+        parser.add_argument(
+            '--keep-originals',
+            action='store_true',
+            help='Не удалять исходные файлы после переноса.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        moved, missing, originals = 0, 0, set()
+        last_pk = 0
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .exclude(image='')
+                .order_by('pk')
+                .values_list('pk', 'image')[:options['chunk_size']]
+            )
+            if not posts:
+                break
+            last_pk = posts[-1][0]
+            for pk, name in posts:
+                if storage.is_hashed(name):
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                with storage.open(name) as content:
+                    new_name = storage.save(name, content)
+                Post.objects.filter(pk=pk).update(
+                    image=new_name, updated=timezone.now()
+                )
+                originals.add(name)
+                moved += 1
+        if not options['keep_originals']:
+            for name in originals:
+                # Исходники не учтены в StoredFile, удаляем их напрямую.
+                FileSystemStorage.delete(storage, name)
+        if moved:
+            invalidate(SHARED_SCOPE)
+        self.stdout.write(
+            f'Перенесено картинок: {moved}, без файла: {missing}, '
+            f'исходников: {len(originals)}'
+        )
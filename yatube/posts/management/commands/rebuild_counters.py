@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.counters import (rebuild_group_counters, rebuild_post_counters,
+                            rebuild_user_counters)
+from posts.models import Group, Post
+from posts.trending import rebuild_group_trending, rebuild_post_trending
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов, подписок и комментариев '
+            'и счета популярного.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько записей пересчитывать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        targets = (
+            ('пользователей', User, rebuild_user_counters),
+            ('групп', Group, rebuild_group_counters),
+            ('постов', Post, rebuild_post_counters),
+            ('групп (популярное)', Group, rebuild_group_trending),
+            ('постов (популярное)', Post, rebuild_post_trending),
+        )
+        for name, model, rebuild in targets:
+            total = 0
+            for ids in self.chunks(model, chunk_size):
+                rebuild(ids)
+                total += len(ids)
+            self.stdout.write(f'Пересчитано {name}: {total}')
+
+    @staticmethod
+    def chunks(model, chunk_size):
+        """Первичные ключи модели порциями, без OFFSET."""
+        last_pk = 0
+        while True:
+            ids = list(
+                model.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return
+            yield ids
+            last_pk = ids[-1]
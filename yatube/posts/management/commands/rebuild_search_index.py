@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Заново строит полнотекстовый индекс постов и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько записей индексировать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        posts, comments = rebuild_index(options['chunk_size'])
+        self.stdout.write(
+            f'Проиндексировано постов: {posts}, комментариев: {comments}'
+        )
@@ -0,0 +1,314 @@
+import io
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from faker import Faker
+from mixer.backend.django import Mixer
+from PIL import Image
+
+from core.models import StoredFile
+from posts import follow_graph, thumbnails
+from posts.caching import SHARED_SCOPE, invalidate
+from posts.counters import (rebuild_group_counters, rebuild_post_counters,
+                            rebuild_user_counters)
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+from posts.trending import rebuild_group_trending, rebuild_post_trending
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+PASSWORD = 'seed-password'
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу тестовыми данными для нагрузочных замеров: '
+            'пользователи, группы, посты с картинками, комментарии '
+            'и подписки со степенным распределением.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20,
+            help='Среднее число подписок одного пользователя.',
+        )
+        parser.add_argument(
+            '--exponent',
+            type=float,
+            default=1.2,
+            help='Показатель степенного закона популярности авторов.',
+        )
+        parser.add_argument(
+            '--image-ratio',
+            type=float,
+            default=0.3,
+            help='Доля постов с картинкой.',
+        )
+        parser.add_argument(
+            '--image-variants',
+            type=int,
+            default=20,
+            help='Сколько разных картинок сгенерировать.',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько дней раскидать даты постов.',
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.mixer = Mixer(commit=False, locale='ru_RU')
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days'])
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            groups = self.create_groups(options['groups'])
+            weights = self.popularity(len(users), options['exponent'])
+            posts = self.create_posts(
+                options['posts'], users, groups, weights, options
+            )
+            comments = self.create_comments(options['comments'], users, posts)
+            follows = self.create_follows(users, weights, options['follows'])
+            entries = self.fill_timelines(follows, posts)
+            self.rebuild_counters(users, groups, posts)
+            for post in posts:
+                thumbnails.schedule(post)
+        thumbnails.wait()
+        invalidate(SHARED_SCOPE)
+        user_ids = [user.pk for user in users]
+        follow_graph.forget(user_ids)
+        self.stdout.write(
+            f'Создано пользователей: {len(users)}, групп: {len(groups)}, '
+            f'постов: {len(posts)}, комментариев: {comments}, '
+            f'подписок: {len(follows)}, записей лент: {entries}'
+        )
+
+    def popularity(self, count, exponent):
+        """Веса авторов по закону Ципфа в случайном порядке."""
+        weights = [1 / rank ** exponent for rank in range(1, count + 1)]
+        self.random.shuffle(weights)
+        return weights
+
+    def spread_dates(self, objects, start, end):
+        """Раскидывает даты создания по отрезку после bulk_create.
+
+        bulk_create проставляет `created = now()` из-за auto_now_add,
+        а bulk_update пишет значения как есть.
+        """
+        for obj in objects:
+            obj.created = start(obj) + (end(obj) - start(obj)) * (
+                self.random.random()
+            )
+        type(objects[0]).objects.bulk_update(
+            objects, ['created'], batch_size=BATCH_SIZE
+        )
+
+    def create_users(self, count):
+        prefix = self.faker.unique.user_name()
+        password = make_password(PASSWORD)
+        users = self.mixer.cycle(count).blend(
+            User,
+            username=(f'{prefix}_{i}' for i in range(count)),
+            first_name=self.faker.first_name,
+            last_name=self.faker.last_name,
+            password=password,
+            is_staff=False,
+            is_superuser=False,
+            is_active=True,
+        )
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+        # SQLite не возвращает ключи из bulk_create.
+        return list(User.objects.filter(
+            username__startswith=prefix + '_'
+        ).order_by('pk'))
+
+    def create_groups(self, count):
+        prefix = self.faker.unique.slug()
+        groups = self.mixer.cycle(count).blend(
+            Group,
+            title=lambda: self.faker.catch_phrase()[:200],
+            slug=(f'{prefix}-{i}' for i in range(count)),
+            description=self.faker.text,
+        )
+        Group.objects.bulk_create(groups, batch_size=BATCH_SIZE)
+        return list(Group.objects.filter(
+            slug__startswith=prefix + '-'
+        ).order_by('pk'))
+
+    def create_images(self, variants):
+        """Картинки кладутся в хранилище по хэшу по одному разу."""
+        names = []
+        for _ in range(variants):
+            image = Image.new('RGB', (640, 480), tuple(
+                self.random.randrange(256) for _ in range(3)
+            ))
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG')
+            storage = Post._meta.get_field('image').storage
+            names.append(storage.save(
+                'posts/seed.jpg', ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def create_posts(self, count, users, groups, weights, options):
+        images = []
+        if options['image_ratio'] > 0 and options['image_variants'] > 0:
+            images = self.create_images(options['image_variants'])
+        authors = self.random.choices(users, weights, k=count)
+        group_weights = self.popularity(len(groups), options['exponent'])
+        usage = dict.fromkeys(images, 0)
+
+        def pick_group():
+            if not groups or self.random.random() < 0.3:
+                return None
+            return self.random.choices(groups, group_weights)[0]
+
+        def pick_image():
+            if not images or self.random.random() >= options['image_ratio']:
+                return ''
+            name = self.random.choice(images)
+            usage[name] += 1
+            return name
+
+        posts = self.mixer.cycle(count).blend(
+            Post,
+            author=(author for author in authors),
+            group=pick_group,
+            text=lambda: self.faker.paragraph(nb_sentences=5),
+            image=pick_image,
+            # Миниатюры делает пул после коммита, см. handle.
+            thumbnail='',
+        )
+        last_pk = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by('pk'))
+        if posts:
+            self.spread_dates(
+                posts,
+                lambda post: self.now - self.period,
+                lambda post: self.now,
+            )
+        # Первая ссылка на картинку учтена при сохранении в хранилище.
+        # Ненужную картинку хранилище отпускает само и после коммита
+        # удаляет файл, если других ссылок на него нет.
+        storage = Post._meta.get_field('image').storage
+        for name in images:
+            if usage[name]:
+                StoredFile.objects.filter(name=name).update(
+                    references=F('references') + usage[name] - 1
+                )
+            else:
+                storage.delete(name)
+        return posts
+
+    def create_comments(self, count, users, posts):
+        if not posts:
+            return 0
+        last_pk = Comment.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        # Комментируют чаще популярные посты — тоже по степенному закону.
+        weights = self.popularity(len(posts), 1.0)
+        comments = self.mixer.cycle(count).blend(
+            Comment,
+            post=(
+                post
+                for post in self.random.choices(posts, weights, k=count)
+            ),
+            author=lambda: self.random.choice(users),
+            text=lambda: self.faker.sentence(nb_words=12),
+        )
+        Comment.objects.bulk_create(comments, batch_size=BATCH_SIZE)
+        comments = list(Comment.objects.filter(
+            pk__gt=last_pk
+        ).select_related('post').only('created', 'post__created'))
+        if comments:
+            self.spread_dates(
+                comments,
+                lambda comment: comment.post.created,
+                lambda comment: self.now,
+            )
+        return len(comments)
+
+    def create_follows(self, users, weights, mean):
+        """Число подписок у пользователя распределено экспоненциально,
+        а выбор автора — по весам популярности, поэтому число подписчиков
+        подчиняется степенному закону.
+        """
+        pairs = set()
+        for user in users:
+            wanted = min(
+                len(users) - 1, round(self.random.expovariate(1 / mean))
+            ) if mean > 0 else 0
+            authors = set()
+            for _ in range(wanted * 3):
+                if len(authors) >= wanted:
+                    break
+                author = self.random.choices(users, weights)[0]
+                if author.pk != user.pk:
+                    authors.add(author.pk)
+            pairs.update((user.pk, author_id) for author_id in authors)
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, author_id in pairs
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return pairs
+
+    def fill_timelines(self, follows, posts):
+        """Ленты подписок строятся сразу, без сигналов по каждой записи.
+
+        Записей — подписчики × посты автора, поэтому они создаются
+        лениво и пишутся порциями: bulk_create сам превратил бы
+        генератор в список целиком.
+        """
+        by_author = {}
+        for post in posts:
+            by_author.setdefault(post.author_id, []).append(
+                (post.pk, post.created)
+            )
+        entries = (
+            TimelineEntry(user_id=user_id, post_id=post_id, created=created)
+            for user_id, author_id in follows
+            for post_id, created in by_author.get(author_id, ())
+        )
+        total = 0
+        while True:
+            batch = list(islice(entries, BATCH_SIZE))
+            if not batch:
+                return total
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+
+    def rebuild_counters(self, users, groups, posts):
+        for objects, rebuild in (
+            (users, rebuild_user_counters),
+            (groups, rebuild_group_counters),
+            (posts, rebuild_post_counters),
+            (groups, rebuild_group_trending),
+            (posts, rebuild_post_trending),
+        ):
+            for start in range(0, len(objects), BATCH_SIZE):
+                rebuild([obj.pk for obj in objects[start:start + BATCH_SIZE]])
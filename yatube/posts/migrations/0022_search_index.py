@@ -0,0 +1,58 @@
+from django.db import migrations
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE posts_search USING fts5("
+    "body, post_id UNINDEXED, tokenize='unicode61')",
+    # Пост хранится в строке с rowid = id * 2, комментарий — id * 2 + 1.
+    "CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post "
+    "BEGIN INSERT INTO posts_search (rowid, body, post_id) "
+    "VALUES (new.id * 2, new.text, new.id); END",
+    "CREATE TRIGGER posts_search_post_update AFTER UPDATE OF text "
+    "ON posts_post BEGIN UPDATE posts_search SET body = new.text "
+    "WHERE rowid = new.id * 2; END",
+    "CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post "
+    "BEGIN DELETE FROM posts_search WHERE rowid = old.id * 2; END",
+    "CREATE TRIGGER posts_search_comment_insert AFTER INSERT "
+    "ON posts_comment BEGIN INSERT INTO posts_search (rowid, body, post_id) "
+    "VALUES (new.id * 2 + 1, new.text, new.post_id); END",
+    "CREATE TRIGGER posts_search_comment_update AFTER UPDATE OF text "
+    "ON posts_comment BEGIN UPDATE posts_search SET body = new.text "
+    "WHERE rowid = new.id * 2 + 1; END",
+    "CREATE TRIGGER posts_search_comment_delete AFTER DELETE "
+    "ON posts_comment BEGIN DELETE FROM posts_search "
+    "WHERE rowid = old.id * 2 + 1; END",
+    "INSERT INTO posts_search (rowid, body, post_id) "
+    "SELECT id * 2, text, id FROM posts_post",
+    "INSERT INTO posts_search (rowid, body, post_id) "
+    "SELECT id * 2 + 1, text, post_id FROM posts_comment",
+)
+
+DROP_SQL = (
+    'DROP TRIGGER IF EXISTS posts_search_post_insert',
+    'DROP TRIGGER IF EXISTS posts_search_post_update',
+    'DROP TRIGGER IF EXISTS posts_search_post_delete',
+    'DROP TRIGGER IF EXISTS posts_search_comment_insert',
+    'DROP TRIGGER IF EXISTS posts_search_comment_update',
+    'DROP TRIGGER IF EXISTS posts_search_comment_delete',
+    'DROP TABLE IF EXISTS posts_search',
+)
+
+
+def run_sql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(CREATE_SQL), run_sql(DROP_SQL)),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-17 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='trending',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='trending',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['trending'], name='group_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['trending'], name='post_trending_idx'),
+        ),
+    ]
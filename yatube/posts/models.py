@@ -2,6 +2,7 @@ from django.contrib.auth import get_user_model
 from django.db import models
 
 from core.models import CustomTextModel, DateTimeModel
+from core.storage import content_storage
 
 User = get_user_model()
 
@@ -11,11 +12,47 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    # Счёт популярности с затуханием, его ведёт posts.trending.
+    trending = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('trending',), name='group_trending_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+# Поля поста, которые выводятся в карточке ленты.
+FEED_FIELDS = (
+    'created',
+    'text',
+    'image',
+    'comment_count',
+    'thumbnail',
+    'thumbnail_width',
+    'thumbnail_height',
+    'updated',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__title',
+    'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+
+    def for_feed(self):
+        """Посты для ленты: автор и группа одним запросом, без лишних полей.
+
+        Число комментариев берётся из денормализованного `comment_count`.
+        """
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+
 class Post(DateTimeModel, CustomTextModel):
     group = models.ForeignKey(
         Group,
@@ -26,8 +63,59 @@ class Post(DateTimeModel, CustomTextModel):
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=content_storage,
         blank=True
     )
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Готовая миниатюра для карточки, её делает пул из posts.thumbnails.
+    thumbnail = models.ImageField(
+        upload_to='posts/thumbs/',
+        blank=True,
+        editable=False,
+    )
+    thumbnail_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
+    thumbnail_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
+    # Меняется при любой правке, влияющей на карточку поста;
+    # входит в ключ кэша отрисованной карточки.
+    updated = models.DateTimeField(auto_now=True)
+    # Счёт популярности с затуханием, его ведёт posts.trending.
+    trending = models.FloatField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta(DateTimeModel.Meta):
+        indexes = [
+            models.Index(fields=('created',), name='post_created_idx'),
+            models.Index(
+                fields=('author', 'created'),
+                name='post_author_created_idx'),
+            models.Index(
+                fields=('group', 'created'),
+                name='post_group_created_idx'),
+            # Для валидаторов условного GET: последняя правка в ленте.
+            models.Index(fields=('updated',), name='post_updated_idx'),
+            models.Index(
+                fields=('author', 'updated'),
+                name='post_author_updated_idx'),
+            models.Index(
+                fields=('group', 'updated'),
+                name='post_group_updated_idx'),
+            # Для страницы популярного: первые N по счёту.
+            models.Index(fields=('trending',), name='post_trending_idx'),
+        ]
+
+
+class CommentQuerySet(models.QuerySet):
+
+    def for_thread(self):
+        """Комментарии для страницы поста: автор тем же запросом."""
+        return self.select_related('author').only(
+            'created', 'text', 'post', 'author__username'
+        )
 
 
 class Comment(DateTimeModel, CustomTextModel):
@@ -37,6 +125,15 @@ class Comment(DateTimeModel, CustomTextModel):
         related_name='comments',
     )
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta(DateTimeModel.Meta):
+        indexes = [
+            models.Index(
+                fields=('post', 'created'),
+                name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
 
@@ -57,3 +154,85 @@ class Follow(models.Model):
                 fields=('user', 'author'),
                 name="unique subscription"),
         ]
+        indexes = [
+            models.Index(
+                fields=('author', 'user'),
+                name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+
+    def for_feed(self):
+        """Записи ленты подписок вместе с постами для карточек."""
+        return self.select_related('post__author', 'post__group').only(
+            'created', 'post', *('post__' + field for field in FEED_FIELDS)
+        )
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок: пост автора, на которого подписан user.
+
+    Дата поста копируется, чтобы лента читалась одним проходом по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    created = models.DateTimeField()
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name="unique timeline entry"),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-created', '-post'),
+                name='timeline_user_created_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, обновляемые сигналами."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    post_count = models.PositiveIntegerField(default=0)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class Recommendation(models.Model):
+    """Кандидат для подписки, посчитанный командой build_recommendations."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+    )
+    candidate = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'rank'),
+                name="unique recommendation rank"),
+        ]
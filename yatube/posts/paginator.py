@@ -0,0 +1,190 @@
+from math import ceil
+
+from django.core import signing
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'posts.paginator.cursor'
+NEXT = 'n'
+PREVIOUS = 'p'
+LAST = 'l'
+
+
+class KeysetPaginator(Paginator):
+    """Пагинатор по ключу (created, id) без OFFSET и COUNT.
+
+    Страница ищется по курсору — подписанному токену с ключом крайней
+    записи соседней страницы. Номера страниц (`?page=N`) поддерживаются
+    только для первых `legacy_pages` страниц. Второе поле ключа `tie_key`
+    должно быть уникальным в пределах выборки.
+
+    Навигация — окно из `window` страниц по обе стороны от текущей:
+    курсор дальней страницы пропускает несколько страниц от крайней
+    записи текущей. Ссылка на последнюю страницу есть, если известно
+    число записей `count` — счётчик или оценка, COUNT не выполняется.
+    """
+
+    def __init__(self, object_list, per_page, legacy_pages=5, tie_key='id',
+                 count=None, window=2):
+        super().__init__(
+            object_list.order_by('-created', '-' + tie_key), per_page
+        )
+        self.legacy_pages = legacy_pages
+        self.tie_key = tie_key
+        self.total = count
+        self.window = window
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        """Число страниц по оценке `count`, но не меньше известного:
+        текущая и, если есть, следующая.
+        """
+        return self._num_pages
+
+    def estimated_pages(self):
+        if not self.total:
+            return 0
+        return ceil(self.total / self.per_page)
+
+    def get_page(self, number=None, cursor=None):
+        if cursor is not None:
+            try:
+                key = signing.loads(cursor, salt=CURSOR_SALT)
+                return self._page_from_cursor(key)
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                pass
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        if not 1 <= number <= self.legacy_pages:
+            number = 1
+        bottom = (number - 1) * self.per_page
+        rows = self.rows(bottom, self.per_page + 1)
+        if not rows and number > 1:
+            return self.get_page(1)
+        return self._build_page(
+            rows[:self.per_page], number, len(rows) > self.per_page
+        )
+
+    def rows(self, offset, limit):
+        """Записи по смещению — только для первых страниц."""
+        return list(self.object_list[offset:offset + limit])
+
+    def rows_after(self, key, limit, offset=0):
+        """Записи, следующие за ключом, в порядке выдачи.
+
+        `offset` пропускает записи страниц между текущей и нужной.
+        """
+        created, pk = parse_datetime(key[0]), int(key[1])
+        if created is None:
+            raise ValueError('Некорректный курсор')
+        return list(self.object_list.filter(
+            Q(created__lt=created)
+            | Q(created=created, **{self.tie_key + '__lt': pk})
+        )[offset:offset + limit])
+
+    def rows_before(self, key, limit, offset=0):
+        """Записи, предшествующие ключу, начиная с ближайшей."""
+        created, pk = parse_datetime(key[0]), int(key[1])
+        if created is None:
+            raise ValueError('Некорректный курсор')
+        return list(self.object_list.filter(
+            Q(created__gt=created)
+            | Q(created=created, **{self.tie_key + '__gt': pk})
+        ).reverse()[offset:offset + limit])
+
+    def rows_last(self, limit):
+        """Последние записи выдачи в порядке выдачи."""
+        rows = list(self.object_list.reverse()[:limit])
+        rows.reverse()
+        return rows
+
+    def get_key(self, obj):
+        """Ключ записи для курсора; значения должны сериализоваться в JSON."""
+        return [obj.created.isoformat(), getattr(obj, self.tie_key)]
+
+    def _page_from_cursor(self, key):
+        number = int(key['p'])
+        if key['d'] == LAST:
+            rows = self.rows_last(int(key['n']))
+            if not rows:
+                return self.get_page(1)
+            return self._build_page(rows, number, False)
+        offset = int(key.get('s', 0)) * self.per_page
+        if key['d'] == NEXT:
+            rows = self.rows_after(key['k'], self.per_page + 1, offset)
+            return self._build_page(
+                rows[:self.per_page], number, len(rows) > self.per_page
+            )
+        rows = self.rows_before(key['k'], self.per_page + 1, offset)
+        if len(rows) <= self.per_page or number <= 1:
+            # Перед найденными записями ничего нет — это первая страница.
+            return self.get_page(1)
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return self._build_page(rows, number, True)
+
+    def _build_page(self, rows, number, has_next):
+        self._num_pages = number
+        if has_next:
+            self._num_pages = max(number + 1, self.estimated_pages())
+        page = Page(rows, number, self)
+        page.previous_cursor = None
+        page.next_cursor = None
+        page.last_cursor = None
+        page.window = [(number, None)]
+        if not rows:
+            return page
+        if number > 1:
+            page.previous_cursor = self._make_cursor(
+                rows[0], PREVIOUS, number - 1
+            )
+        if has_next:
+            page.next_cursor = self._make_cursor(rows[-1], NEXT, number + 1)
+        page.window = self._window(rows, number, has_next)
+        last = page.window[-1][0]
+        if self.estimated_pages() > last:
+            page.last_cursor = self._make_last_cursor()
+        return page
+
+    def _window(self, rows, number, has_next):
+        """Пары (номер, курсор) страниц окна; у текущей курсора нет,
+        у первой он пустой — на неё ведёт адрес без параметров.
+        """
+        window = []
+        for other in range(max(1, number - self.window), number):
+            cursor = ''
+            if other > 1:
+                cursor = self._make_cursor(
+                    rows[0], PREVIOUS, other, number - other - 1
+                )
+            window.append((other, cursor))
+        window.append((number, None))
+        last = min(self._num_pages, number + self.window) if has_next else 0
+        for other in range(number + 1, last + 1):
+            window.append((other, self._make_cursor(
+                rows[-1], NEXT, other, other - number - 1
+            )))
+        return window
+
+    def _make_cursor(self, obj, direction, number, skip=0):
+        key = {
+            'k': self.get_key(obj),
+            'd': direction,
+            'p': number,
+        }
+        if skip:
+            key['s'] = skip
+        return signing.dumps(key, salt=CURSOR_SALT, compress=True)
+
+    def _make_last_cursor(self):
+        pages = self.estimated_pages()
+        key = {
+            'd': LAST,
+            'p': pages,
+            'n': self.total - (pages - 1) * self.per_page,
+        }
+        return signing.dumps(key, salt=CURSOR_SALT, compress=True)
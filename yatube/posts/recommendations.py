@@ -0,0 +1,110 @@
+import heapq
+from array import array
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from . import follow_graph
+from .caching import RECOMMENDATIONS_SCOPE, invalidate
+from .models import Follow, Recommendation
+
+BATCH_SIZE = 500
+# Подписки друзей весят больше, чем подписки похожих читателей.
+FRIEND_WEIGHT = 2
+# Сколько самых похожих читателей учитывать для каждого пользователя.
+SIMILAR_LIMIT = 50
+
+
+def load_adjacency():
+    """Таблица Follow в виде строк разреженной матрицы смежности.
+
+    Возвращает два словаря id -> отсортированный array('i'): подписки
+    пользователей (строки A) и их подписчиков (строки транспонированной A).
+    """
+    followees, followers = defaultdict(list), defaultdict(list)
+    rows = Follow.objects.order_by('user_id', 'author_id').values_list(
+        'user_id', 'author_id'
+    )
+    for user_id, author_id in rows.iterator():
+        followees[user_id].append(author_id)
+        followers[author_id].append(user_id)
+    return (
+        {key: array('i', ids) for key, ids in followees.items()},
+        {key: array('i', sorted(ids)) for key, ids in followers.items()},
+    )
+
+
+def score_candidates(user_id, followees, followers):
+    """Очки кандидатов для пользователя — строка `2·A² + (A·Aᵀ)·A`.
+
+    A² считает, сколько друзей пользователя подписаны на кандидата.
+    A·Aᵀ даёт похожих читателей с весом по числу общих подписок, а
+    умножение на A — на кого подписаны они. Сам пользователь и те,
+    на кого он уже подписан, в выдачу не попадают.
+    """
+    own = followees.get(user_id, ())
+    scores = Counter()
+    similar = Counter()
+    for author_id in own:
+        for candidate in followees.get(author_id, ()):
+            scores[candidate] += FRIEND_WEIGHT
+        similar.update(followers.get(author_id, ()))
+    similar.pop(user_id, None)
+    for reader_id, weight in similar.most_common(SIMILAR_LIMIT):
+        for candidate in followees.get(reader_id, ()):
+            scores[candidate] += weight
+    scores.pop(user_id, None)
+    for author_id in own:
+        scores.pop(author_id, None)
+    return scores
+
+
+def top_candidates(scores, count):
+    """Лучшие кандидаты; при равных очках — с меньшим id."""
+    return heapq.nsmallest(
+        count, scores.items(), key=lambda item: (-item[1], item[0])
+    )
+
+
+def build(count):
+    """Пересчитывает рекомендации всех пользователей с подписками.
+
+    Возвращает число сохранённых рекомендаций.
+    """
+    followees, followers = load_adjacency()
+    recommendations = [
+        Recommendation(
+            user_id=user_id, candidate_id=candidate, score=score, rank=rank
+        )
+        for user_id in followees
+        for rank, (candidate, score) in enumerate(top_candidates(
+            score_candidates(user_id, followees, followers), count
+        ))
+    ]
+    with transaction.atomic():
+        Recommendation.objects.all().delete()
+        Recommendation.objects.bulk_create(
+            recommendations, batch_size=BATCH_SIZE
+        )
+        invalidate(RECOMMENDATIONS_SCOPE)
+    return len(recommendations)
+
+
+def for_user(request, count):
+    """Рекомендации текущему пользователю одним запросом по индексу.
+
+    На тех, на кого он подписался после пересчёта, уже не предлагаем.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return []
+    recommendations = Recommendation.objects.filter(
+        user=user
+    ).select_related('candidate').order_by('rank')
+    candidates = []
+    for recommendation in recommendations[:count * 2]:
+        candidate = recommendation.candidate
+        if follow_graph.is_following(user.pk, candidate.pk):
+            continue
+        candidates.append(candidate)
+    return candidates[:count]
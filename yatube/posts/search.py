@@ -0,0 +1,166 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+
+from .models import Post
+from .paginator import KeysetPaginator
+
+SEARCH_TABLE = 'posts_search'
+
+RANKED_POSTS = f'''
+    SELECT post_id, MIN(rank) AS score FROM (
+        SELECT post_id, rank FROM {SEARCH_TABLE}
+        WHERE {SEARCH_TABLE} MATCH %s
+    )
+    GROUP BY post_id
+'''
+
+# Пост хранится в строке индекса с rowid = id * 2, комментарий — id * 2 + 1.
+TRIGGERS = (
+    'CREATE TRIGGER IF NOT EXISTS posts_search_post_insert '
+    'AFTER INSERT ON posts_post BEGIN '
+    'INSERT INTO posts_search (rowid, body, post_id) '
+    'VALUES (new.id * 2, new.text, new.id); END',
+    'CREATE TRIGGER IF NOT EXISTS posts_search_post_update '
+    'AFTER UPDATE OF text ON posts_post BEGIN '
+    'UPDATE posts_search SET body = new.text WHERE rowid = new.id * 2; END',
+    'CREATE TRIGGER IF NOT EXISTS posts_search_post_delete '
+    'AFTER DELETE ON posts_post BEGIN '
+    'DELETE FROM posts_search WHERE rowid = old.id * 2; END',
+    'CREATE TRIGGER IF NOT EXISTS posts_search_comment_insert '
+    'AFTER INSERT ON posts_comment BEGIN '
+    'INSERT INTO posts_search (rowid, body, post_id) '
+    'VALUES (new.id * 2 + 1, new.text, new.post_id); END',
+    'CREATE TRIGGER IF NOT EXISTS posts_search_comment_update '
+    'AFTER UPDATE OF text ON posts_comment BEGIN '
+    'UPDATE posts_search SET body = new.text '
+    'WHERE rowid = new.id * 2 + 1; END',
+    'CREATE TRIGGER IF NOT EXISTS posts_search_comment_delete '
+    'AFTER DELETE ON posts_comment BEGIN '
+    'DELETE FROM posts_search WHERE rowid = old.id * 2 + 1; END',
+)
+
+
+def create_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Восстанавливает триггеры индекса после миграций.
+
+    SQLite пересоздаёт таблицу при изменении её схемы, и триггеры
+    на posts_post и posts_comment пропадают вместе со старой таблицей.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    if SEARCH_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in TRIGGERS:
+            cursor.execute(statement)
+
+
+def build_match(query):
+    """Превращает ввод пользователя в запрос FTS5 из слов в кавычках."""
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+
+class SearchPaginator(KeysetPaginator):
+    """Постраничная выдача поиска, упорядоченная по BM25.
+
+    Ключ курсора — пара (score, post_id); чем меньше score, тем выше пост.
+    Число результатов не считается, поэтому последней страницы в
+    навигации нет.
+    """
+
+    def __init__(self, match, per_page, legacy_pages=5, window=2):
+        super().__init__(
+            Post.objects.for_feed(), per_page, legacy_pages, window=window
+        )
+        self.match = match
+
+    def rows(self, offset, limit):
+        return self._fetch(
+            'ORDER BY score, post_id LIMIT %s OFFSET %s', [limit, offset]
+        )
+
+    def rows_after(self, key, limit, offset=0):
+        score, pk = float(key[0]), int(key[1])
+        return self._fetch(
+            'HAVING score > %s OR (score = %s AND post_id > %s) '
+            'ORDER BY score, post_id LIMIT %s OFFSET %s',
+            [score, score, pk, limit, offset],
+        )
+
+    def rows_before(self, key, limit, offset=0):
+        score, pk = float(key[0]), int(key[1])
+        return self._fetch(
+            'HAVING score < %s OR (score = %s AND post_id < %s) '
+            'ORDER BY score DESC, post_id DESC LIMIT %s OFFSET %s',
+            [score, score, pk, limit, offset],
+        )
+
+    def get_key(self, obj):
+        return [obj.search_score, obj.id]
+
+    def _fetch(self, tail, params):
+        if not self.match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(RANKED_POSTS + tail, [self.match] + params)
+            ranked = cursor.fetchall()
+        posts = self.object_list.in_bulk([post_id for post_id, _ in ranked])
+        rows = []
+        for post_id, score in ranked:
+            post = posts.get(post_id)
+            if post is not None:
+                post.search_score = score
+                rows.append(post)
+        return rows
+
+
+def rebuild_index(chunk_size=1000):
+    """Заново индексирует посты и комментарии порциями по первичному ключу.
+
+    Каждая порция — своя транзакция: писатели ждут одну порцию, а не
+    всю перестройку. Порция заменяет строки индекса только в своём
+    диапазоне rowid, поэтому поиск всё время работает, а строки,
+    которые триггеры добавили по ходу перестройки, не дублируются.
+    Строки за последним id удаляются в транзакции, которая убеждается,
+    что записей больше нет.
+
+    Возвращает число проиндексированных постов и комментариев.
+    """
+    # Таблица, чётность rowid в индексе и id поста для строки.
+    sources = (
+        ('posts_post', 0, 'id'),
+        ('posts_comment', 1, 'post_id'),
+    )
+    totals = []
+    for table, parity, post_id in sources:
+        last_id, total = 0, 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT MAX(id), COUNT(*) FROM ('
+                    f'SELECT id FROM {table} WHERE id > %s '
+                    f'ORDER BY id LIMIT %s)',
+                    [last_id, chunk_size],
+                )
+                max_id, count = cursor.fetchone()
+                stale = (
+                    f'DELETE FROM {SEARCH_TABLE} '
+                    f'WHERE rowid > %s AND (rowid & 1) = %s'
+                )
+                params = [last_id * 2 + parity, parity]
+                if not count:
+                    cursor.execute(stale, params)
+                    break
+                cursor.execute(stale + ' AND rowid <= %s',
+                               params + [max_id * 2 + parity])
+                cursor.execute(
+                    f'INSERT INTO {SEARCH_TABLE} (rowid, body, post_id) '
+                    f'SELECT id * 2 + {parity}, text, {post_id} '
+                    f'FROM {table} WHERE id > %s AND id <= %s',
+                    [last_id, max_id],
+                )
+            last_id, total = max_id, total + count
+        totals.append(total)
+    return totals
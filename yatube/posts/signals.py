@@ -0,0 +1,238 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import follow_graph, fragments, thumbnails, timeline, trending
+from .caching import (GROUP_SCOPE, PROFILE_SCOPE, SHARED_SCOPE,
+                      TRENDING_SCOPE, invalidate, post_scopes)
+from .counters import change_counter
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, **kwargs):
+    """Запоминает группу и картинку до правки поста и то, загружен ли
+    сейчас новый файл: хранилище добавит ему ссылку, даже если по
+    содержимому он совпадёт с прежним.
+    """
+    instance._previous = {}
+    instance._uploaded_image = bool(
+        instance.image and not instance.image._committed
+    )
+    if instance.pk is not None:
+        instance._previous = (
+            Post.objects.filter(pk=instance.pk)
+            .values('group_id', 'group__slug', 'image', 'thumbnail')
+            .first()
+        ) or {}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    scopes = post_scopes(instance)
+    previous_slug = getattr(instance, '_previous', {}).get('group__slug')
+    if previous_slug is not None:
+        scopes.append(GROUP_SCOPE.format(slug=previous_slug))
+    # Пост в группе меняет её счёт и число постов в «Активных сообществах».
+    if instance.group_id is not None or previous_slug is not None:
+        scopes.append(TRENDING_SCOPE)
+    invalidate(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, **kwargs):
+    scopes = post_scopes(instance.post)
+    if instance.post.group_id is not None:
+        scopes.append(TRENDING_SCOPE)
+    invalidate(*scopes)
+
+
+# Поля, которые видны в карточке поста.
+AUTHOR_CARD_FIELDS = ('username', 'first_name', 'last_name')
+GROUP_CARD_FIELDS = ('title', 'slug')
+
+
+def remember_card_fields(instance, fields, update_fields):
+    instance._previous_card = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return
+    instance._previous_card = (
+        type(instance).objects.filter(pk=instance.pk)
+        .values_list(*fields).first()
+    )
+
+
+def card_fields_changed(instance, fields):
+    previous = getattr(instance, '_previous_card', None)
+    current = tuple(getattr(instance, field) for field in fields)
+    return previous is not None and previous != current
+
+
+@receiver(pre_save, sender=User)
+def remember_author_names(sender, instance, update_fields=None, **kwargs):
+    remember_card_fields(instance, AUTHOR_CARD_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=User)
+def touch_renamed_author_posts(sender, instance, **kwargs):
+    if card_fields_changed(instance, AUTHOR_CARD_FIELDS):
+        fragments.touch_posts(author=instance)
+        invalidate(SHARED_SCOPE)
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_names(sender, instance, update_fields=None, **kwargs):
+    remember_card_fields(instance, GROUP_CARD_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=Group)
+def touch_renamed_group_posts(sender, instance, **kwargs):
+    if card_fields_changed(instance, GROUP_CARD_FIELDS):
+        fragments.touch_posts(group=instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, **kwargs):
+    invalidate(SHARED_SCOPE, TRENDING_SCOPE)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feeds(sender, instance, **kwargs):
+    """Подписка меняет страницы обоих: у автора — число подписчиков
+    и кнопку, у читателя — число подписок.
+    """
+    invalidate(
+        PROFILE_SCOPE.format(username=instance.author.username),
+        PROFILE_SCOPE.format(username=instance.user.username),
+    )
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def sync_follow_graph(sender, instance, **kwargs):
+    # Версия меняется сразу и ещё раз после коммита: массив, прочитанный
+    # до коммита, не переживёт его, а откатившаяся подписка не попадёт
+    # в снимок.
+    follow_graph.forget([instance.user_id])
+    transaction.on_commit(lambda: follow_graph.refresh(instance.user_id))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        change_counter(UserStats, instance.author_id, 'post_count', 1)
+        if instance.group_id is not None:
+            change_counter(Group, instance.group_id, 'post_count', 1)
+        return
+    previous_group_id = instance._previous.get('group_id')
+    if previous_group_id != instance.group_id:
+        if previous_group_id is not None:
+            change_counter(Group, previous_group_id, 'post_count', -1)
+        if instance.group_id is not None:
+            change_counter(Group, instance.group_id, 'post_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_counter(UserStats, instance.author_id, 'post_count', -1)
+    if instance.group_id is not None:
+        change_counter(Group, instance.group_id, 'post_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Post, instance.post_id, 'comment_count', 1, touch=True
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_counter(Post, instance.post_id, 'comment_count', -1, touch=True)
+
+
+@receiver(post_save, sender=Post)
+def count_trending_post(sender, instance, created, **kwargs):
+    if created:
+        trending.count_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_trending_comment(sender, instance, created, **kwargs):
+    # Удалённые комментарии из счёта не вычитаются: их вклад и так
+    # затухает, а точные значения восстанавливает rebuild_counters.
+    if created:
+        trending.count_comment(instance)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        change_counter(UserStats, instance.author_id, 'follower_count', 1)
+        change_counter(UserStats, instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_counter(UserStats, instance.author_id, 'follower_count', -1)
+    change_counter(UserStats, instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, created, **kwargs):
+    previous_image = instance._previous.get('image')
+    if not previous_image or not (instance._uploaded_image
+                                  or previous_image != instance.image.name):
+        return
+    instance.image.storage.delete(previous_image)
+    # Миниатюра старой картинки больше не подходит; пока не готова
+    # новая, карточка показывает саму картинку.
+    previous_thumbnail = instance._previous.get('thumbnail')
+    if previous_thumbnail:
+        Post.objects.filter(pk=instance.pk).update(
+            thumbnail='', thumbnail_width=None, thumbnail_height=None
+        )
+        instance.thumbnail = ''
+        instance.thumbnail_width = instance.thumbnail_height = None
+        thumbnails.release(previous_thumbnail)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+    if instance.thumbnail:
+        thumbnails.release(instance.thumbnail.name)
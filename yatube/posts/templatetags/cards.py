@@ -0,0 +1,18 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..fragments import render_cards, render_post_body
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, show_group=False):
+    """HTML карточек постов из кэша фрагментов, в порядке ленты."""
+    return [mark_safe(card) for card in render_cards(posts, show_group)]
+
+
+@register.simple_tag
+def post_body(post, post_amount):
+    """Пост на его странице из кэша фрагментов."""
+    return mark_safe(render_post_body(post, post_amount))
@@ -0,0 +1,22 @@
+from django import template
+
+from yatube.settings import RECOMMENDATION_COUNT
+
+from .. import follow_graph, recommendations
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, author_id):
+    """Подписан ли текущий пользователь на автора — по графу в памяти."""
+    user = context.request.user
+    if not user.is_authenticated or not author_id:
+        return False
+    return follow_graph.is_following(user.pk, author_id)
+
+
+@register.simple_tag(takes_context=True)
+def who_to_follow(context):
+    """Посчитанные заранее рекомендации для текущего пользователя."""
+    return recommendations.for_user(context.request, RECOMMENDATION_COUNT)
@@ -0,0 +1,11 @@
+from django import template
+
+from ..trending import top_groups
+
+register = template.Library()
+
+
+@register.simple_tag
+def trending_groups():
+    """Самые активные сообщества для боковой колонки."""
+    return top_groups()
@@ -0,0 +1,273 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.core.cache import cache
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+
+from core.models import StoredFile
+from ..management.commands import seed_data
+from ..models import (Comment, Follow, Group, Post, Recommendation,
+                      TimelineEntry, UserStats)
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedDataTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'seed_data',
+            users=15,
+            groups=3,
+            posts=60,
+            comments=40,
+            follows=4,
+            image_variants=2,
+            image_ratio=0.5,
+            seed=1,
+            stdout=StringIO(),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_seed_creates_requested_volumes(self):
+        """Сидер создаёт заданное число записей."""
+        expected = {
+            User: 15,
+            Group: 3,
+            Post: 60,
+            Comment: 40,
+            UserStats: 15,
+        }
+        for model, count in expected.items():
+            with self.subTest(model=model.__name__):
+                self.assertEqual(model.objects.count(), count)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+
+    def test_seed_keeps_derived_data_consistent(self):
+        """Счётчики, ленты подписок и ссылки на картинки согласованы."""
+        for stats in UserStats.objects.select_related('user'):
+            with self.subTest(user=stats.user.username):
+                self.assertEqual(
+                    stats.post_count, stats.user.posts.count()
+                )
+                self.assertEqual(
+                    stats.follower_count, stats.user.following.count()
+                )
+        for post in Post.objects.all():
+            with self.subTest(post=post.pk):
+                self.assertEqual(post.comment_count, post.comments.count())
+        expected_entries = sum(
+            follow.author.posts.count()
+            for follow in Follow.objects.select_related('author')
+        )
+        self.assertEqual(TimelineEntry.objects.count(), expected_entries)
+        for stored in StoredFile.objects.all():
+            with self.subTest(name=stored.name):
+                self.assertEqual(
+                    stored.references,
+                    Post.objects.filter(image=stored.name).count(),
+                )
+        self.assertFalse(Comment.objects.filter(
+            created__lt=F('post__created')
+        ).exists())
+
+    def test_timelines_are_written_in_batches(self):
+        """Ленты больше одной порции записываются полностью."""
+        TimelineEntry.objects.all().delete()
+        users = list(User.objects.values_list('pk', flat=True))
+        follows = {
+            (user_id, author_id)
+            for user_id in users for author_id in users
+            if user_id != author_id
+        }
+        expected = sum(
+            Post.objects.filter(author_id=author_id).count()
+            for _, author_id in follows
+        )
+        self.assertGreater(expected, seed_data.BATCH_SIZE)
+        total = seed_data.Command().fill_timelines(
+            follows, list(Post.objects.all())
+        )
+        self.assertEqual(total, expected)
+        self.assertEqual(TimelineEntry.objects.count(), expected)
+
+    def test_benchmark_saves_and_compares_baseline(self):
+        """Бенчмарк пишет JSON и сравнивает с ним следующий замер."""
+        path = os.path.join(TEMP_MEDIA_ROOT, 'baseline.json')
+        call_command(
+            'benchmark_feeds',
+            requests=2,
+            depths='1,2',
+            output=path,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+        with open(path) as file:
+            baseline = json.load(file)
+        for name in ('index@1', 'index@2', 'group_posts@1', 'profile@1',
+                     'post_detail@1', 'follow_index@1'):
+            with self.subTest(name=name):
+                self.assertIn(name, baseline)
+                self.assertLessEqual(
+                    baseline[name]['p50_ms'], baseline[name]['p99_ms']
+                )
+                self.assertGreater(baseline[name]['queries'], 0)
+        output = StringIO()
+        call_command(
+            'benchmark_feeds',
+            requests=2,
+            depths='1,2',
+            baseline=path,
+            stdout=output,
+            stderr=StringIO(),
+        )
+        self.assertIn('Сравнение с baseline', output.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class SeedImageTests(TransactionTestCase):
+    """Транзакции настоящие: файлы удаляются, а миниатюры делаются
+    в on_commit.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # База между тестами очищается, файлы — нет.
+        shutil.rmtree(
+            os.path.join(TEMP_MEDIA_ROOT, 'posts'), ignore_errors=True
+        )
+
+    def test_unused_images_leave_no_files(self):
+        """Картинки, не доставшиеся постам, удаляются вместе с файлами."""
+        call_command(
+            'seed_data',
+            users=2,
+            groups=1,
+            posts=2,
+            comments=0,
+            follows=0,
+            image_variants=3,
+            image_ratio=0.01,
+            seed=1,
+            stdout=StringIO(),
+        )
+        stored = set(StoredFile.objects.values_list('name', flat=True))
+        self.assertEqual(stored, set(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+        ))
+        stored |= set(
+            Post.objects.exclude(thumbnail='')
+            .values_list('thumbnail', flat=True)
+        )
+        on_disk = {
+            os.path.relpath(os.path.join(root, name), TEMP_MEDIA_ROOT)
+            for root, _, files in os.walk(
+                os.path.join(TEMP_MEDIA_ROOT, 'posts')
+            )
+            for name in files
+        }
+        self.assertEqual(on_disk, stored)
+
+    def test_seeded_posts_get_thumbnails(self):
+        """Посты с картинкой из сидера получают миниатюры."""
+        call_command(
+            'seed_data',
+            users=2,
+            groups=1,
+            posts=3,
+            comments=0,
+            follows=0,
+            image_variants=1,
+            image_ratio=1,
+            seed=1,
+            stdout=StringIO(),
+        )
+        for post in Post.objects.all():
+            with self.subTest(post=post.pk):
+                self.assertTrue(post.thumbnail)
+                self.assertTrue(os.path.exists(post.thumbnail.path))
+
+
+class BuildRecommendationsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = {
+            name: User.objects.create_user(username=name)
+            for name in ('reader', 'friend', 'other', 'first', 'second',
+                         'similar')
+        }
+        follows = (
+            ('reader', 'friend'),
+            ('reader', 'other'),
+            ('friend', 'first'),
+            ('other', 'first'),
+            ('other', 'second'),
+            ('similar', 'friend'),
+            ('similar', 'other'),
+            ('similar', 'second'),
+        )
+        for user, author in follows:
+            Follow.objects.create(
+                user=cls.users[user], author=cls.users[author]
+            )
+
+    def setUp(self):
+        cache.clear()
+        call_command('build_recommendations', top=2, stdout=StringIO())
+
+    def candidates(self, name):
+        return [
+            recommendation.candidate.username
+            for recommendation in Recommendation.objects.filter(
+                user=BuildRecommendationsTests.users[name]
+            ).order_by('rank')
+        ]
+
+    def test_friends_and_similar_readers_are_scored(self):
+        """Подписки друзей и похожих читателей, без себя и своих подписок."""
+        self.assertEqual(self.candidates('reader'), ['first', 'second'])
+        scores = Recommendation.objects.filter(
+            user=BuildRecommendationsTests.users['reader']
+        ).values_list('score', flat=True)
+        self.assertEqual(list(scores), [4, 4])
+        for name in self.candidates('similar'):
+            with self.subTest(name=name):
+                self.assertNotIn(name, ('similar', 'friend', 'other'))
+
+    def test_follow_page_shows_recommendations(self):
+        """Лента подписок показывает тех, на кого ещё не подписан."""
+        reader = BuildRecommendationsTests.users['reader']
+        client = Client()
+        client.force_login(reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Кого почитать')
+        self.assertContains(response, 'href="/profile/first/"')
+        Follow.objects.create(
+            user=reader, author=BuildRecommendationsTests.users['first']
+        )
+        response = client.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, 'href="/profile/first/"')
+        self.assertContains(response, 'href="/profile/second/"')
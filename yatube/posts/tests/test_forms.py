@@ -1,5 +1,6 @@
 import shutil
 import tempfile
+from hashlib import sha256
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -83,7 +84,7 @@ class PostFormTests(TestCase):
                 text='Этот пост создан в процессе тестирования',
                 author=PostFormTests.user,
                 group=PostFormTests.group,
-                image=f'posts/{image.name}',
+                image__endswith=sha256(small_gif).hexdigest() + '.gif',
             ).exists()
         )
 
@@ -130,7 +131,10 @@ class PostFormTests(TestCase):
             'Тестовый пост изменён в процессе тестирования',
         )
         self.assertEqual(edited_post.group.id, PostFormTests.group.id)
-        self.assertEqual(edited_post.image.name.split('/')[-1], image.name)
+        self.assertEqual(
+            edited_post.image.name.split('/')[-1],
+            sha256(small_gif).hexdigest() + '.gif'
+        )
 
     def test_post_form_labels(self):
         """У формы PostForm корректные label."""
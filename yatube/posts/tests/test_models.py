@@ -1,7 +1,15 @@
+from datetime import timedelta
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from yatube.settings import TRENDING_HALF_LIFE
 
-from ..models import Group, Post
+from .. import trending
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -34,3 +42,114 @@ class PostModelTest(TestCase):
                     PostModelTest.__getattribute__(self, field).__str__(),
                     expected_name
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_changes(self):
+        """Сигналы поддерживают счётчики постов, подписок и комментариев."""
+        post = Post.objects.create(
+            author=CountersTest.user,
+            group=CountersTest.group,
+            text='Тестовый пост',
+        )
+        Comment.objects.create(
+            author=CountersTest.follower,
+            post=post,
+            text='Комментарий',
+        )
+        Follow.objects.create(
+            user=CountersTest.follower,
+            author=CountersTest.user,
+        )
+        author_stats = UserStats.objects.get(user=CountersTest.user)
+        self.assertEqual(author_stats.post_count, 1)
+        self.assertEqual(author_stats.follower_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=CountersTest.follower).following_count,
+            1
+        )
+        self.assertEqual(Group.objects.get(pk=post.group_id).post_count, 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).comment_count, 1)
+        post.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=CountersTest.user).post_count, 0
+        )
+        self.assertEqual(Group.objects.get(pk=post.group_id).post_count, 0)
+
+    def test_rebuild_counters_fixes_drift(self):
+        """Команда rebuild_counters пересчитывает разошедшиеся счётчики."""
+        post = Post.objects.create(
+            author=CountersTest.user,
+            group=CountersTest.group,
+            text='Тестовый пост',
+        )
+        UserStats.objects.filter(user=CountersTest.user).update(post_count=7)
+        Group.objects.filter(pk=CountersTest.group.pk).update(post_count=0)
+        Post.objects.filter(pk=post.pk).update(comment_count=3)
+        call_command('rebuild_counters', chunk_size=1, stdout=StringIO())
+        self.assertEqual(
+            UserStats.objects.get(user=CountersTest.user).post_count, 1
+        )
+        self.assertEqual(
+            Group.objects.get(pk=CountersTest.group.pk).post_count, 1
+        )
+        self.assertEqual(Post.objects.get(pk=post.pk).comment_count, 0)
+
+
+class TrendingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+
+    def test_weight_halves_every_half_life(self):
+        """Событие периода полураспада назад весит вдвое меньше."""
+        now = timezone.now()
+        earlier = now - timedelta(seconds=TRENDING_HALF_LIFE)
+        self.assertAlmostEqual(
+            trending.total([(2, earlier)]), trending.total([(1, now)])
+        )
+        self.assertAlmostEqual(
+            trending.total([(1, now), (1, now)]), trending.total([(2, now)])
+        )
+
+    def test_rebuild_matches_incremental_scores(self):
+        """Пересчёт с нуля даёт те же счета, что накопили сигналы."""
+        post = Post.objects.create(
+            author=TrendingTest.user,
+            group=TrendingTest.group,
+            text='Тестовый пост',
+        )
+        for i in range(3):
+            Comment.objects.create(
+                author=TrendingTest.user, post=post, text=f'Комментарий {i}'
+            )
+        scores = (
+            Post.objects.get(pk=post.pk).trending,
+            Group.objects.get(pk=TrendingTest.group.pk).trending,
+        )
+        Post.objects.update(trending=0)
+        Group.objects.update(trending=0)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertAlmostEqual(
+            Post.objects.get(pk=post.pk).trending, scores[0]
+        )
+        self.assertAlmostEqual(
+            Group.objects.get(pk=TrendingTest.group.pk).trending, scores[1]
+        )
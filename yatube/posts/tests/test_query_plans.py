@@ -0,0 +1,97 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?!CONSTANT ROW)\w+$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц ленты идут по индексам, без полного перебора
+    таблиц и без сортировки во временном B-дереве.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'Тестовый пост номер {i}',
+            )
+        Comment.objects.create(
+            author=cls.follower,
+            post=cls.post,
+            text='Комментарий',
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(QueryPlanTests.follower)
+
+    def get_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, url, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            for detail in self.get_plan(sql):
+                with self.subTest(url=url, sql=sql, detail=detail):
+                    self.assertIsNone(FULL_SCAN.match(detail))
+                    self.assertNotIn(TEMP_SORT, detail)
+        return response
+
+    def test_feed_pages_use_indexes(self):
+        """Первые и следующие страницы лент читаются по индексам."""
+        urls = (
+            reverse('posts:index'),
+            reverse(
+                'posts:group_list',
+                kwargs={'slug': QueryPlanTests.group.slug}
+            ),
+            reverse(
+                'posts:profile',
+                kwargs={'username': QueryPlanTests.user.username}
+            ),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            response = self.assert_indexed(url)
+            next_cursor = response.context['page_obj'].next_cursor
+            self.assert_indexed(url, {'cursor': next_cursor})
+
+    def test_post_detail_uses_indexes(self):
+        """Страница поста и её комментарии читаются по индексам."""
+        self.assert_indexed(reverse(
+            'posts:post_detail',
+            kwargs={'post_id': QueryPlanTests.post.id}
+        ))
+
+    def test_trending_uses_indexes(self):
+        """Популярные посты и группы читаются по индексу счёта."""
+        self.assert_indexed(reverse('posts:trending'))
@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from .. import thumbnails
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+ORIENTATION_TAG = 0x0112
+ROTATED_CLOCKWISE = 6
+
+
+def jpeg(color):
+    buffer = BytesIO()
+    Image.new('RGB', (400, 300), color).save(buffer, 'JPEG')
+    return ContentFile(buffer.getvalue(), f'{color}.jpg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.source_path = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'photo.jpg')
+        os.makedirs(os.path.dirname(cls.source_path), exist_ok=True)
+        # Левая половина красная, правая синяя; EXIF велит повернуть
+        # картинку на 90° по часовой стрелке, и красное окажется сверху.
+        image = Image.new('RGB', (400, 300), 'blue')
+        image.paste('red', (0, 0, 200, 300))
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = ROTATED_CLOCKWISE
+        image.save(cls.source_path, 'JPEG', exif=exif.tobytes())
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            image='posts/photo.jpg',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_render_variant_applies_exif_orientation(self):
+        """Миниатюра поворачивается по EXIF и обрезается до размера."""
+        target_path = os.path.join(TEMP_MEDIA_ROOT, 'thumb.jpg')
+        size = thumbnails.render_variant(
+            ThumbnailTests.source_path, target_path, thumbnails.CARD_SIZE
+        )
+        self.assertEqual(size, thumbnails.CARD_SIZE)
+        with Image.open(target_path) as thumbnail:
+            red, _, blue = thumbnail.getpixel((640, 10))
+            self.assertGreater(red, blue)
+            red, _, blue = thumbnail.getpixel((640, 710))
+            self.assertGreater(blue, red)
+
+    def test_draft_size_follows_exif_orientation(self):
+        """Для повёрнутой по EXIF картинки draft уменьшает её по
+        повёрнутым осям, иначе миниатюра вышла бы растянутой.
+        """
+        with Image.open(ThumbnailTests.source_path) as image:
+            self.assertEqual(
+                thumbnails.draft_size(image, thumbnails.CARD_SIZE),
+                (720, 1280),
+            )
+        with Image.new('RGB', (400, 300)) as image:
+            self.assertEqual(
+                thumbnails.draft_size(image, thumbnails.CARD_SIZE),
+                thumbnails.CARD_SIZE,
+            )
+
+    def test_generate_stores_thumbnail_on_post(self):
+        """Готовая миниатюра и её размеры сохраняются в посте."""
+        thumbnails.generate(ThumbnailTests.post.pk, 'posts/photo.jpg')
+        post = Post.objects.get(pk=ThumbnailTests.post.pk)
+        self.assertTrue(post.thumbnail.name.startswith('posts/thumbs/'))
+        self.assertEqual(
+            (post.thumbnail_width, post.thumbnail_height),
+            thumbnails.CARD_SIZE,
+        )
+        self.assertTrue(os.path.exists(post.thumbnail.path))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailReplacementTests(TransactionTestCase):
+    """Транзакции настоящие: старая миниатюра удаляется в on_commit."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='username')
+        self.post = Post.objects.create(
+            author=self.user, text='Пост с картинкой', image=jpeg('red')
+        )
+
+    def thumbnail_name(self):
+        return Post.objects.get(pk=self.post.pk).thumbnail.name
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+
+    def test_new_image_replaces_thumbnail(self):
+        """Замена картинки сразу убирает старую миниатюру, новая
+        получает другое имя.
+        """
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        first = self.thumbnail_name()
+        self.post.image = jpeg('blue')
+        self.post.save()
+        self.assertEqual(self.thumbnail_name(), '')
+        self.assertFalse(self.exists(first))
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        second = self.thumbnail_name()
+        self.assertNotEqual(first, second)
+        self.assertTrue(self.exists(second))
+
+    def test_late_result_for_replaced_image_is_dropped(self):
+        """Миниатюра старой картинки, готовая после замены, не
+        записывается в пост, а её файл удаляется.
+        """
+        old_image = self.post.image.name
+        self.post.image = jpeg('blue')
+        self.post.save()
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        current = self.thumbnail_name()
+        late = 'posts/thumbs/late.jpg'
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'thumbs'),
+                    exist_ok=True)
+        open(os.path.join(TEMP_MEDIA_ROOT, late), 'w').close()
+        thumbnails.store(self.post.pk, old_image, late, thumbnails.CARD_SIZE)
+        self.assertEqual(self.thumbnail_name(), current)
+        self.assertFalse(self.exists(late))
+
+    def test_deleting_post_releases_thumbnail(self):
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        name = self.thumbnail_name()
+        Post.objects.get(pk=self.post.pk).delete()
+        self.assertFalse(self.exists(name))
+
+    def test_same_image_keeps_thumbnail(self):
+        """Повторная генерация из того же файла не удаляет миниатюру."""
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        self.assertTrue(self.exists(self.thumbnail_name()))
+
+    def test_command_backfills_missing_thumbnails(self):
+        """generate_thumbnails делает миниатюры постам без них."""
+        Post.objects.create(author=self.user, text='Пост без картинки')
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Обработано постов с картинкой: 1', out.getvalue())
+        self.assertTrue(self.exists(self.thumbnail_name()))
@@ -55,6 +55,7 @@ class PostURLTests(TestCase):
             f'/posts/{PostURLTests.post.id}/comment/': HTTPStatus.FOUND,
             '/create/': HTTPStatus.FOUND,
             '/follow/': HTTPStatus.FOUND,
+            '/search/?q=пост': HTTPStatus.OK,
             '/unexisting_page/': HTTPStatus.NOT_FOUND,
         }
         for url, expected_status_code in expected_responses.items():
@@ -1,17 +1,34 @@
 import shutil
 import tempfile
+import time
+from hashlib import sha256
+from io import StringIO
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_cache_key
 
-from yatube.settings import PAGE_CAPACITY
+from yatube.settings import (COMMENT_PAGE_CAPACITY, FEED_CACHE_JITTER,
+                             FEED_CACHE_TIMEOUT, PAGE_CAPACITY)
 
-from ..models import Follow, Group, Post
+from core.identity import identity_map, load_object_or_404
+from core.metrics import registry
+from core.routers import ReplicaMiddleware
+from ..caching import (FEED_KEY_PREFIX, INDEX_SCOPE, LOCK_KEY, invalidate,
+                       render_shared)
+from .. import follow_graph, recommendations
+from ..fragments import card_key, touch_posts
+from ..models import Comment, Follow, Group, Post, TimelineEntry
 
 User = get_user_model()
 
@@ -51,6 +68,7 @@ class PostViewTests(TestCase):
             content=small_gif,
             content_type='image/gif'
         )
+        cls.image_name = sha256(small_gif).hexdigest() + '.gif'
         cls.group_post = Post.objects.create(
             author=cls.user,
             group=cls.group,
@@ -110,7 +128,7 @@ class PostViewTests(TestCase):
         self.assertEqual(post.group, PostViewTests.group)
         self.assertEqual(
             post.image.name.split('/')[-1],
-            PostViewTests.image.name
+            PostViewTests.image_name
         )
 
     def test_index_page_show_correct_context_no_group_post(self):
@@ -121,18 +139,42 @@ class PostViewTests(TestCase):
         self.assertEqual(post.author, PostViewTests.user)
 
     def test_cache_index(self):
-        """Главная страница правильно работает с кэшем."""
+        """Главная страница берётся из кэша, пока посты не менялись."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=PostViewTests.post.pk).update(
+            text='Изменено в обход сигналов'
+        )
+        response_cached = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response.content, response_cached.content)
+        cache.clear()
+        response_after = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(response.content, response_after.content)
+
+    def test_cache_index_invalidated_on_post_changes(self):
+        """Создание и удаление поста сразу сбрасывают кэш главной."""
+        response = self.authorized_client.get(reverse('posts:index'))
         post = Post.objects.create(
             text='Тестовый пост для проверки кэша',
             author=PostViewTests.user,
         )
-        response = self.authorized_client.get(reverse('posts:index'))
+        response_created = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(response.content, response_created.content)
+        self.assertContains(response_created, post.text)
         post.delete()
-        response_before = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response.content, response_before.content)
-        cache.clear()
-        response_after = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(response.content, response_after.content)
+        response_deleted = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response_deleted, post.text)
+
+    def test_cache_group_invalidated_on_group_change(self):
+        """Правка группы сбрасывает кэш её ленты."""
+        url = reverse(
+            'posts:group_list', kwargs={'slug': PostViewTests.group.slug}
+        )
+        self.authorized_client.get(url)
+        group = Group.objects.get(pk=PostViewTests.group.pk)
+        group.description = 'Новое описание группы'
+        group.save()
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Новое описание группы')
 
     def test_group_list_page_show_correct_context(self):
         """Шаблон group_list сформирован с правильным контекстом."""
@@ -146,7 +188,7 @@ class PostViewTests(TestCase):
         self.assertEqual(post.author, PostViewTests.user)
         self.assertEqual(
             post.image.name.split('/')[-1],
-            PostViewTests.image.name
+            PostViewTests.image_name
         )
         self.assertEqual(len(response.context['page_obj']), 1)
 
@@ -171,7 +213,7 @@ class PostViewTests(TestCase):
         self.assertEqual(post.author, PostViewTests.user)
         self.assertEqual(
             post.image.name.split('/')[-1],
-            PostViewTests.image.name
+            PostViewTests.image_name
         )
 
     def test_post_detail_page_show_correct_context(self):
@@ -189,7 +231,7 @@ class PostViewTests(TestCase):
         self.assertEqual(post.author, PostViewTests.user)
         self.assertEqual(
             post.image.name.split('/')[-1],
-            PostViewTests.image.name
+            PostViewTests.image_name
         )
 
     def test_post_edit_page_show_correct_context(self):
@@ -300,7 +342,7 @@ class PostViewTests(TestCase):
         self.assertEqual(group_post.group, PostViewTests.group)
         self.assertEqual(
             group_post.image.name.split('/')[-1],
-            PostViewTests.image.name
+            PostViewTests.image_name
         )
         self.assertEqual(post.text, 'Пост без группы')
         self.assertEqual(post.author, PostViewTests.user)
@@ -450,3 +492,905 @@ class PostViewPaginatorTests(TestCase):
         response = (self.follower_client.
                     get(reverse('posts:follow_index') + '?page=2'))
         self.assertEqual(len(response.context['page_obj']), 6)
+
+    def test_index_next_cursor_leads_to_second_page(self):
+        """Курсор следующей страницы ведёт на вторую страницу."""
+        first_page = self.authorized_client.get(
+            reverse('posts:index')
+        ).context['page_obj']
+        cache.clear()
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': first_page.next_cursor}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertFalse(page_obj.has_next())
+        self.assertEqual(len(page_obj), 6)
+        self.assertEqual(page_obj[0].text, 'Тестовый пост номер 5')
+
+    def test_index_previous_cursor_leads_to_first_page(self):
+        """Курсор предыдущей страницы возвращает на первую страницу."""
+        second_page = self.authorized_client.get(
+            reverse('posts:index') + '?page=2'
+        ).context['page_obj']
+        cache.clear()
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': second_page.previous_cursor}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertEqual(len(page_obj), PAGE_CAPACITY)
+        self.assertEqual(page_obj[0].text, 'Тестовый пост номер 15')
+
+    def test_index_broken_cursor_shows_first_page(self):
+        """Повреждённый курсор и слишком дальний номер
+        открывают первую страницу.
+        """
+        for params in ({'cursor': 'broken'}, {'page': 1000}):
+            with self.subTest(params=params):
+                cache.clear()
+                response = self.authorized_client.get(
+                    reverse('posts:index'), params
+                )
+                self.assertEqual(response.context['page_obj'].number, 1)
+
+
+class WindowedPaginatorTests(TestCase):
+    """Навигация — окно вокруг текущей страницы и ссылка на последнюю."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for i in range(PAGE_CAPACITY * 5 + 3):
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'Пост {i}',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.url = reverse(
+            'posts:group_list',
+            kwargs={'slug': WindowedPaginatorTests.group.slug},
+        )
+
+    def get_page(self, cursor=None):
+        cache.clear()
+        params = {'cursor': cursor} if cursor is not None else {}
+        return self.client.get(self.url, params).context['page_obj']
+
+    def texts(self, page_obj):
+        return [post.text for post in page_obj]
+
+    def expected(self, number):
+        last = PAGE_CAPACITY * 5 + 2 - (number - 1) * PAGE_CAPACITY
+        return [
+            f'Пост {i}' for i in range(last, max(last - PAGE_CAPACITY, -1), -1)
+        ]
+
+    def test_window_and_last_page(self):
+        """Окно ограничено, курсоры ведут на нужные страницы."""
+        with CaptureQueriesContext(connection) as context:
+            first = self.get_page()
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in context.captured_queries
+        ))
+        self.assertEqual(first.paginator.num_pages, 6)
+        self.assertEqual(
+            [number for number, _ in first.window], [1, 2, 3]
+        )
+        third = self.get_page(first.window[-1][1])
+        self.assertEqual(third.number, 3)
+        self.assertEqual(self.texts(third), self.expected(3))
+        self.assertEqual(
+            [number for number, _ in third.window], [1, 2, 3, 4, 5]
+        )
+        second = self.get_page(third.window[1][1])
+        self.assertEqual(self.texts(second), self.expected(2))
+        last = self.get_page(first.last_cursor)
+        self.assertEqual(last.number, 6)
+        self.assertFalse(last.has_next())
+        self.assertEqual(self.texts(last), self.expected(6))
+        fourth = self.get_page(last.window[0][1])
+        self.assertEqual(fourth.number, 4)
+        self.assertEqual(self.texts(fourth), self.expected(4))
+        self.assertIsNone(fourth.last_cursor)
+
+    def test_html_has_bounded_number_of_links(self):
+        """Число ссылок не зависит от числа страниц."""
+        response = self.client.get(self.url)
+        self.assertContains(response, 'class="page-link"', count=5)
+        self.assertContains(response, 'Последняя (6)')
+
+
+class CommentThreadTests(TestCase):
+    """Комментарии выводятся порциями, остальные подгружаются."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        for i in range(COMMENT_PAGE_CAPACITY * 2 + 5):
+            Comment.objects.create(
+                author=User.objects.create_user(username=f'reader{i}'),
+                post=cls.post,
+                text=f'Комментарий {i}',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.url = reverse(
+            'posts:post_detail',
+            kwargs={'post_id': CommentThreadTests.post.pk},
+        )
+        self.fragment_url = reverse(
+            'posts:post_comments',
+            kwargs={'post_id': CommentThreadTests.post.pk},
+        )
+
+    def test_first_chunk_is_inline_without_n_plus_one(self):
+        """Первая порция на странице, авторы тем же запросом."""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENT_PAGE_CAPACITY)
+        self.assertEqual(
+            comments[0].text, f'Комментарий {COMMENT_PAGE_CAPACITY * 2 + 4}'
+        )
+        self.assertContains(response, 'data-comments=')
+
+    def test_fragment_returns_next_chunks(self):
+        """Фрагмент отдаёт следующие порции без обвязки страницы."""
+        cursor = self.client.get(self.url).context['comments'].next_cursor
+        response = self.client.get(self.fragment_url, {'cursor': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENT_PAGE_CAPACITY)
+        self.assertEqual(
+            comments[0].text, f'Комментарий {COMMENT_PAGE_CAPACITY + 4}'
+        )
+        response = self.client.get(
+            self.fragment_url, {'cursor': comments.next_cursor}
+        )
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertNotContains(response, 'data-comments=')
+
+    def test_post_body_is_cached_apart_from_comments(self):
+        """Тело поста берётся из кэша, пока пост не изменился."""
+        self.client.get(self.url)
+        Post.objects.update(text='Изменено в обход сигналов')
+        response = self.client.get(self.url)
+        self.assertContains(response, '<p>Пост</p>', html=True)
+        post = Post.objects.get(pk=CommentThreadTests.post.pk)
+        post.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Изменено в обход сигналов')
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Пост до подписки',
+        )
+
+    def test_follow_backfills_and_unfollow_prunes_timeline(self):
+        """Подписка переносит посты автора в ленту, отписка убирает их."""
+        follow = Follow.objects.create(
+            user=TimelineTests.follower,
+            author=TimelineTests.author,
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=TimelineTests.follower,
+                post=TimelineTests.old_post,
+            ).exists()
+        )
+        follow.delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=TimelineTests.follower).exists()
+        )
+
+    def test_new_post_is_pushed_to_followers(self):
+        """Новый пост попадает в ленты подписчиков автора."""
+        Follow.objects.create(
+            user=TimelineTests.follower,
+            author=TimelineTests.author,
+        )
+        post = Post.objects.create(
+            author=TimelineTests.author,
+            text='Пост после подписки',
+        )
+        entry = TimelineEntry.objects.get(
+            user=TimelineTests.follower,
+            post=post,
+        )
+        self.assertEqual(entry.created, post.created)
+
+
+class FollowGraphTests(TestCase):
+    """Подписки читаются из графа в памяти и обновляются сразу."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(FollowGraphTests.reader)
+
+    def test_graph_answers_without_database(self):
+        """Прогретый граф отвечает без запросов к базе."""
+        reader, authors = FollowGraphTests.reader, FollowGraphTests.authors
+        for author in authors[::-1][:2]:
+            Follow.objects.create(user=reader, author=author)
+        self.assertEqual(
+            list(follow_graph.followees(reader.pk)),
+            sorted(author.pk for author in authors[1:]),
+        )
+        with self.assertNumQueries(0):
+            self.assertTrue(follow_graph.is_following(
+                reader.pk, authors[2].pk
+            ))
+            self.assertFalse(follow_graph.is_following(
+                reader.pk, authors[0].pk
+            ))
+
+    def test_follow_views_keep_graph_in_sync(self):
+        """Подписка и отписка сразу видны в графе и на странице."""
+        reader, author = FollowGraphTests.reader, FollowGraphTests.authors[0]
+        profile = reverse('posts:profile', kwargs={'username': 'author0'})
+        self.assertContains(self.client.get(profile), 'Подписаться')
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author0'})
+        )
+        self.assertTrue(follow_graph.is_following(reader.pk, author.pk))
+        self.assertContains(self.client.get(profile), 'Отписаться')
+        self.client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'author0'})
+        )
+        self.assertFalse(follow_graph.is_following(reader.pk, author.pk))
+
+    def test_follow_updates_reader_profile(self):
+        """Закэшированная страница читателя показывает новое число подписок."""
+        profile = reverse('posts:profile', kwargs={'username': 'reader'})
+        self.assertContains(self.client.get(profile), 'Подписок: 0')
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author0'})
+        )
+        self.assertContains(self.client.get(profile), 'Подписок: 1')
+
+    def test_process_copy_follows_shared_version(self):
+        """Массив в памяти процесса отвечает без снимка, пока версия
+        в общем кэше не сменится, например подпиской в другом процессе.
+        """
+        reader, author = FollowGraphTests.reader, FollowGraphTests.authors[0]
+        self.assertFalse(cache.is_local(
+            follow_graph.VERSION_KEY.format(reader.pk)
+        ))
+        follow_graph.followees(reader.pk)
+        cache.delete(follow_graph.FOLLOWEES_KEY.format(reader.pk))
+        # Подписка в обход сигналов: граф о ней ещё не знает.
+        Follow.objects.bulk_create([Follow(user=reader, author=author)])
+        with self.assertNumQueries(0):
+            self.assertFalse(follow_graph.is_following(reader.pk, author.pk))
+        follow_graph.forget([reader.pk])
+        self.assertTrue(follow_graph.is_following(reader.pk, author.pk))
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов страниц ленты не зависит от числа постов."""
+    # С пустым кэшем index и follow_index один раз считают записи,
+    # а profile загружает подписки читателя в граф. Profile и follow_index
+    # ещё одним запросом по индексу читают блок «Кого почитать»,
+    # а group_list — активные сообщества.
+    BUDGETS = {
+        'posts:index': 3,
+        'posts:group_list': 3,
+        'posts:profile': 4,
+        'posts:follow_index': 3,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='username',
+            first_name='Имя',
+            last_name='Фамилия',
+        )
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        for i in range(PAGE_CAPACITY):
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'Тестовый пост номер {i}',
+            )
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(QueryBudgetTests.follower)
+        cache.clear()
+        # Сессия и пользователь уже в кэше, считаются только запросы ленты.
+        self.follower_client.get(reverse('about:author'))
+
+    def test_feed_pages_fit_query_budget(self):
+        """Страницы ленты укладываются в бюджет запросов."""
+        kwargs = {
+            'posts:index': {},
+            'posts:group_list': {'slug': QueryBudgetTests.group.slug},
+            'posts:profile': {'username': QueryBudgetTests.user.username},
+            'posts:follow_index': {},
+        }
+        for view_name, budget in self.BUDGETS.items():
+            with self.subTest(view_name=view_name):
+                url = reverse(view_name, kwargs=kwargs[view_name])
+                with self.assertNumQueries(budget):
+                    response = self.follower_client.get(url)
+                self.assertContains(response, 'Имя Фамилия')
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.quiet_group = Group.objects.create(
+            title='Тихая группа', slug='quiet', description='Описание'
+        )
+        cls.busy_group = Group.objects.create(
+            title='Шумная группа', slug='busy', description='Описание'
+        )
+        cls.discussed = Post.objects.create(
+            author=cls.user, group=cls.busy_group, text='Обсуждаемый пост'
+        )
+        cls.fresh = Post.objects.create(
+            author=cls.user, group=cls.quiet_group, text='Новый пост'
+        )
+        for i in range(2):
+            Comment.objects.create(
+                author=cls.user, post=cls.discussed, text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_discussed_posts_come_first(self):
+        """Пост с комментариями выше более нового поста без них."""
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(
+            response.context['posts'],
+            [TrendingTests.discussed, TrendingTests.fresh],
+        )
+
+    def test_new_comments_reorder_trending(self):
+        """Счёт растёт с каждым комментарием, страница обновляется."""
+        self.client.get(reverse('posts:trending'))
+        for i in range(3):
+            Comment.objects.create(
+                author=TrendingTests.user,
+                post=TrendingTests.fresh,
+                text=f'Ответ {i}',
+            )
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(response.context['posts'][0], TrendingTests.fresh)
+
+    def test_group_page_lists_active_groups(self):
+        """Боковая колонка группы показывает самые активные сообщества."""
+        response = self.client.get(reverse(
+            'posts:group_list', kwargs={'slug': TrendingTests.quiet_group.slug}
+        ))
+        content = response.content.decode()
+        self.assertIn('Активные сообщества', content)
+        self.assertLess(
+            content.index('href="/group/busy/"'),
+            content.index('href="/group/quiet/"'),
+        )
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Заметка про сирень и черёмуху',
+        )
+        cls.commented_post = Post.objects.create(
+            author=cls.user,
+            text='Пост без ключевых слов',
+        )
+        Comment.objects.create(
+            author=cls.user,
+            post=cls.commented_post,
+            text='А у нас цветёт сирень',
+        )
+        for i in range(PAGE_CAPACITY + 2):
+            Post.objects.create(author=cls.user, text=f'Ландыш номер {i}')
+
+    def search(self, params):
+        return self.client.get(reverse('posts:search'), params)
+
+    def found(self, query):
+        return len(self.search({'q': query}).context['page_obj'])
+
+    def test_search_finds_posts_and_comments(self):
+        """Поиск находит посты по тексту поста и его комментариев."""
+        response = self.search({'q': 'СИРЕНЬ'})
+        self.assertEqual(
+            {post.id for post in response.context['page_obj']},
+            {SearchTests.post.id, SearchTests.commented_post.id},
+        )
+
+    def test_search_follows_index_changes(self):
+        """Изменение и удаление поста сразу видны в поиске."""
+        Post.objects.filter(pk=SearchTests.post.pk).update(text='Тюльпаны')
+        self.assertEqual(self.found('тюльпаны'), 1)
+        Post.objects.filter(pk=SearchTests.post.pk).delete()
+        self.assertEqual(self.found('тюльпаны'), 0)
+
+    def test_search_pages_with_cursor(self):
+        """Выдача поиска листается курсором без повторов."""
+        first_page = self.search({'q': 'ландыш'}).context['page_obj']
+        second_page = self.search(
+            {'q': 'ландыш', 'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(first_page), PAGE_CAPACITY)
+        self.assertEqual(len(second_page), 2)
+        self.assertFalse(
+            {post.id for post in first_page}
+            & {post.id for post in second_page}
+        )
+        back_page = self.search(
+            {'q': 'ландыш', 'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            [post.id for post in back_page],
+            [post.id for post in first_page],
+        )
+
+    def test_rebuild_search_index(self):
+        """Команда rebuild_search_index заново наполняет индекс."""
+        out = StringIO()
+        call_command('rebuild_search_index', chunk_size=5, stdout=out)
+        self.assertIn('постов: 14, комментариев: 1', out.getvalue())
+        self.assertEqual(self.found('сирень'), 2)
+
+    def test_rebuild_replaces_stale_rows(self):
+        """Перестройка чинит испорченные строки и убирает лишние."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE posts_search SET body = %s WHERE rowid = %s',
+                ['испорчено', SearchTests.post.pk * 2],
+            )
+            cursor.execute(
+                'INSERT INTO posts_search (rowid, body, post_id) '
+                'VALUES (%s, %s, %s), (%s, %s, %s)',
+                [10 ** 6, 'сирень', 5 * 10 ** 5,
+                 10 ** 6 + 1, 'сирень', 5 * 10 ** 5],
+            )
+        call_command('rebuild_search_index', chunk_size=5, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM posts_search')
+            self.assertEqual(cursor.fetchone(), (15,))
+        self.assertEqual(self.found('сирень'), 2)
+        self.assertEqual(self.found('испорчено'), 0)
+
+
+class FeedCacheTests(TestCase):
+    """Устаревшую ленту пересобирает один запрос, остальные получают
+    старую копию.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='username')
+        Post.objects.create(author=cls.user, text='Первый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.url = reverse('posts:index')
+        response = self.client.get(self.url)
+        self.key = get_cache_key(
+            response.wsgi_request, FEED_KEY_PREFIX, 'GET', cache=cache
+        )
+
+    def expire(self):
+        versions, _, response = cache.get(self.key)
+        cache.set(self.key, (versions, time.time() - 1, response))
+
+    def counter(self, result):
+        values = registry.counters.get('feed_cache_total', {})
+        return values.get(f'result="{result}",view="posts:index"', 0)
+
+    def test_server_timeout_is_not_sent_to_clients(self):
+        """Срок кэша сервера не попадает в заголовки ответа."""
+        response = self.client.get(self.url)
+        self.assertNotIn('Expires', response)
+        self.assertNotIn(
+            f'max-age={FEED_CACHE_TIMEOUT}',
+            response.get('Cache-Control', ''),
+        )
+
+    def test_clients_revalidate_every_response(self):
+        """Промах, попадание и старая копия требуют проверки у сервера."""
+        responses = [self.client.get(self.url), self.client.get(self.url)]
+        Post.objects.create(author=FeedCacheTests.user, text='Новый пост')
+        cache.add(LOCK_KEY.format(self.key), True)
+        responses.append(self.client.get(self.url))
+        for response in responses:
+            cache_control = response['Cache-Control']
+            for directive in ('max-age=0', 'no-cache', 'private'):
+                with self.subTest(directive=directive):
+                    self.assertIn(directive, cache_control)
+
+    def test_fresh_page_is_served_from_cache(self):
+        """Свежая страница отдаётся из кэша и считается попаданием."""
+        hits = self.counter('hit')
+        Post.objects.update(text='Изменено в обход сигналов')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Первый пост')
+        self.assertEqual(self.counter('hit'), hits + 1)
+
+    def test_stale_page_is_served_while_locked(self):
+        """Пока страницу пересобирает другой запрос, отдаётся старая копия."""
+        Post.objects.create(author=FeedCacheTests.user, text='Новый пост')
+        cache.add(LOCK_KEY.format(self.key), True)
+        stale = self.counter('stale')
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Новый пост')
+        self.assertEqual(self.counter('stale'), stale + 1)
+        self.assertFalse(response.has_header('ETag'))
+        cache.delete(LOCK_KEY.format(self.key))
+        misses = self.counter('miss')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Новый пост')
+        self.assertEqual(self.counter('miss'), misses + 1)
+
+    def test_expired_page_is_rebuilt_and_lock_released(self):
+        """Истёкшая страница пересобирается, блокировка снимается."""
+        Post.objects.update(
+            text='Изменено в обход сигналов', updated=timezone.now()
+        )
+        self.expire()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Изменено в обход сигналов')
+        self.assertIsNone(cache.get(LOCK_KEY.format(self.key)))
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_shared_render_reloads_objects_read_from_replica(self):
+        """Страница для кэша не берёт объекты, прочитанные с реплики."""
+        request = RequestFactory().get(self.url)
+        stale = User.objects.get(pk=FeedCacheTests.user.pk)
+        stale.first_name = 'Старое имя'
+        identity_map(request).add(stale, username=stale.username)
+        User.objects.filter(pk=stale.pk).update(first_name='Новое имя')
+
+        def view(request):
+            user = load_object_or_404(
+                request, User.objects, username=stale.username
+            )
+            return HttpResponse(user.first_name)
+
+        response = ReplicaMiddleware(
+            lambda request: render_shared(view, request, (), {})
+        )(request)
+        self.assertEqual(response.content.decode(), 'Новое имя')
+
+    def test_freshness_has_jitter(self):
+        """Срок свежести сокращён не больше чем на долю FEED_CACHE_JITTER."""
+        _, fresh_until, _ = cache.get(self.key)
+        remaining = fresh_until - time.time()
+        self.assertLessEqual(remaining, FEED_CACHE_TIMEOUT)
+        self.assertGreater(
+            remaining, FEED_CACHE_TIMEOUT * (1 - FEED_CACHE_JITTER) - 5
+        )
+
+
+class ConditionalGetTests(TestCase):
+    """Клиент с текущей версией страницы получает 304."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.old_post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Старый пост'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Новый пост'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(ConditionalGetTests.reader)
+        self.urls = (
+            reverse('posts:index'),
+            reverse(
+                'posts:group_list',
+                kwargs={'slug': ConditionalGetTests.group.slug},
+            ),
+            reverse(
+                'posts:profile',
+                kwargs={'username': ConditionalGetTests.author.username},
+            ),
+            reverse(
+                'posts:post_detail',
+                kwargs={'post_id': ConditionalGetTests.post.pk},
+            ),
+        )
+
+    def revalidate(self, client, url, response):
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+        if response.has_header('Last-Modified'):
+            headers['HTTP_IF_MODIFIED_SINCE'] = response['Last-Modified']
+        return client.get(url, **headers)
+
+    def test_unchanged_page_is_not_modified(self):
+        """Неизменная страница отдаётся как 304 за один запрос к базе."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(response['ETag'].startswith('W/'))
+                with self.assertNumQueries(1):
+                    response = self.revalidate(self.client, url, response)
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_validators(self):
+        """Новый комментарий, правка и удаление меняют валидаторы."""
+        changes = (
+            lambda: Comment.objects.create(
+                author=ConditionalGetTests.reader,
+                post=ConditionalGetTests.post,
+                text='Комментарий',
+            ),
+            lambda: Post.objects.filter(
+                pk=ConditionalGetTests.post.pk
+            ).first().save(),
+            lambda: Post.objects.filter(
+                pk=ConditionalGetTests.old_post.pk
+            ).delete(),
+        )
+        for change in changes:
+            responses = [self.client.get(url) for url in self.urls]
+            change()
+            for url, response in zip(self.urls, responses):
+                with self.subTest(url=url, change=changes.index(change)):
+                    response = self.revalidate(self.client, url, response)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_deletion_is_not_hidden_by_last_modified(self):
+        """Ленты не отдают Last-Modified: удаление его не сдвигает."""
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                self.assertFalse(
+                    self.client.get(url).has_header('Last-Modified')
+                )
+        response = self.client.get(self.urls[3])
+        Post.objects.filter(pk=ConditionalGetTests.old_post.pk).delete()
+        response = self.client.get(
+            self.urls[0],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Старый пост')
+
+    def test_validators_depend_on_user(self):
+        """У пользователей разные ETag, подписка меняет ETag профиля."""
+        url = self.urls[2]
+        anonymous = self.client.get(url)
+        response = self.reader_client.get(url)
+        self.assertNotEqual(anonymous['ETag'], response['ETag'])
+        Follow.objects.create(
+            user=ConditionalGetTests.reader,
+            author=ConditionalGetTests.author,
+        )
+        response = self.revalidate(self.reader_client, url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отписаться')
+
+    def test_sidebar_changes_invalidate_validators(self):
+        """Боковые блоки из дырок меняют ETag: пост в другой группе
+        двигает «Активные сообщества», пересчёт и подписка — «Кого
+        почитать».
+        """
+        other = Group.objects.create(title='Другая группа', slug='other')
+        other_author = User.objects.create_user(username='other_author')
+        changes = (
+            (self.urls[1], lambda: Post.objects.create(
+                author=ConditionalGetTests.author, group=other, text='Пост'
+            )),
+            (self.urls[0], lambda: recommendations.build(3)),
+            (self.urls[2], lambda: recommendations.build(3)),
+            (self.urls[0], lambda: Follow.objects.create(
+                user=ConditionalGetTests.reader, author=other_author
+            )),
+        )
+        for url, change in changes:
+            response = self.reader_client.get(url)
+            change()
+            with self.subTest(url=url):
+                response = self.revalidate(self.reader_client, url, response)
+                self.assertEqual(response.status_code, 200)
+
+    def test_missing_object_is_not_found(self):
+        """Для несуществующих объектов валидаторы не считаются."""
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'missing'}),
+            HTTP_IF_NONE_MATCH='*',
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class HolePunchingTests(TestCase):
+    """Анонимы и пользователи получают одну закэшированную страницу,
+    а пользовательские фрагменты подставляются при ответе.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        Post.objects.create(author=cls.author, text='Общий пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.follower_client = Client()
+        self.follower_client.force_login(HolePunchingTests.follower)
+        self.reader_client = Client()
+        self.reader_client.force_login(HolePunchingTests.reader)
+
+    def test_index_is_shared_between_users(self):
+        """Главная собирается один раз и показывает каждому свою шапку."""
+        url = reverse('posts:index')
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, 'Избранные авторы')
+        hits = registry.counters['feed_cache_total'].get(
+            'result="hit",view="posts:index"', 0
+        )
+        response = self.follower_client.get(url)
+        self.assertContains(response, 'Пользователь: follower')
+        self.assertContains(response, 'Избранные авторы')
+        self.assertNotContains(response, '<!--hole')
+        self.assertEqual(registry.counters['feed_cache_total'][
+            'result="hit",view="posts:index"'
+        ], hits + 1)
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'follower')
+
+    def test_cached_page_has_no_user_data(self):
+        """В кэш попадает страница с метками вместо фрагментов."""
+        response = self.follower_client.get(reverse('posts:index'))
+        key = get_cache_key(
+            response.wsgi_request, FEED_KEY_PREFIX, 'GET', cache=cache
+        )
+        _, _, cached = cache.get(key)
+        content = cached.content.decode()
+        self.assertIn('<!--hole', content)
+        self.assertIn('Общий пост', content)
+        self.assertNotIn('follower', content)
+
+    def test_follow_button_is_rendered_per_user(self):
+        """Кнопка подписки в профиле своя для каждого пользователя."""
+        url = reverse(
+            'posts:profile',
+            kwargs={'username': HolePunchingTests.author.username}
+        )
+        self.assertContains(self.follower_client.get(url), 'Отписаться')
+        self.assertContains(self.reader_client.get(url), 'Подписаться')
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'Отписаться')
+        self.assertContains(response, 'Войти')
+
+
+class CardCacheTests(TestCase):
+    """Карточки постов кэшируются по (id, updated, версия шаблона)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='author', first_name='Имя', last_name='Фамилия'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Текст карточки'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.url = reverse('posts:index')
+
+    def test_card_is_reused_until_post_changes(self):
+        """Карточка берётся из кэша, пока не изменится `updated`."""
+        self.client.get(self.url)
+        post = Post.objects.get(pk=CardCacheTests.post.pk)
+        self.assertIsNotNone(cache.get(card_key(post, 'group')))
+        Post.objects.update(text='Изменено в обход сигналов')
+        invalidate(INDEX_SCOPE)
+        self.assertContains(self.client.get(self.url), 'Текст карточки')
+        touch_posts(pk=post.pk)
+        invalidate(INDEX_SCOPE)
+        self.assertContains(
+            self.client.get(self.url), 'Изменено в обход сигналов'
+        )
+
+    def test_new_comment_refreshes_card(self):
+        """Новый комментарий меняет счётчик в карточке."""
+        self.client.get(self.url)
+        Comment.objects.create(
+            author=CardCacheTests.user,
+            post=CardCacheTests.post,
+            text='Комментарий',
+        )
+        self.assertContains(self.client.get(self.url), 'Комментариев: 1')
+
+    def test_renames_refresh_cards(self):
+        """Переименование автора или группы меняет карточки."""
+        self.client.get(self.url)
+        user = User.objects.get(pk=CardCacheTests.user.pk)
+        user.first_name = 'Новое'
+        user.save()
+        group = Group.objects.get(pk=CardCacheTests.group.pk)
+        group.title = 'Новая группа'
+        group.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Новое Фамилия')
+        self.assertContains(response, 'все записи группы Новая группа')
+
+    def test_login_does_not_touch_cards(self):
+        """Вход пользователя не сбрасывает кэш его карточек."""
+        updated = Post.objects.get(pk=CardCacheTests.post.pk).updated
+        user = User.objects.get(pk=CardCacheTests.user.pk)
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        self.assertEqual(
+            Post.objects.get(pk=CardCacheTests.post.pk).updated, updated
+        )
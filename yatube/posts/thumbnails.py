@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core.storage import ContentAddressedStorage
+
+from .caching import invalidate, post_scopes
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+CARD_SIZE = (1280, 720)
+# Хэш исходника в имени: новая картинка поста — новый файл миниатюры,
+# и браузеры не показывают из своего кэша старую.
+THUMBNAIL_NAME = 'posts/thumbs/{post_id}_{digest}_{width}x{height}.jpg'
+DIGEST_LENGTH = 16
+EXIF_ORIENTATION = 0x0112
+# При этих значениях EXIF ширина и высота картинки меняются местами.
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+_executor = None
+
+
+def get_executor():
+    """Пул процессов текущего воркера, создаётся при первом обращении."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(settings.THUMBNAIL_WORKERS)
+    return _executor
+
+
+def render_variant(source_path, target_path, size):
+    """Обрезает картинку по центру до size и сохраняет в JPEG.
+
+    Выполняется в дочернем процессе, поэтому работает только с путями.
+    Возвращает размеры сохранённой картинки.
+    """
+    with Image.open(source_path) as image:
+        # Для JPEG декодер сразу уменьшает картинку кратно 2,
+        # не опускаясь ниже нужного размера.
+        image.draft('RGB', draft_size(image, size))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    image.save(target_path, 'JPEG', quality=85, optimize=True)
+    return image.size
+
+
+def draft_size(image, size):
+    """Размер для draft в осях файла, до поворота по EXIF."""
+    if image.getexif().get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+        return size[::-1]
+    return size
+
+
+def source_digest(image_name, source_path):
+    """Хэш содержимого исходника; у хэшированных имён он уже в имени."""
+    if ContentAddressedStorage.is_hashed(image_name):
+        digest = os.path.splitext(os.path.basename(image_name))[0]
+    else:
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as file:
+            for chunk in iter(partial(file.read, 64 * 1024), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+    return digest[:DIGEST_LENGTH]
+
+
+def schedule(post):
+    """Передаёт картинку поста в пул после фиксации транзакции.
+
+    Прежнюю миниатюру при замене или удалении картинки уже убрал
+    сигнал, так что без картинки делать нечего.
+    """
+    if post.image:
+        transaction.on_commit(partial(generate, post.pk, post.image.name))
+
+
+def backfill():
+    """Ставит в очередь миниатюры постов с картинкой, но без миниатюры.
+
+    Возвращает число поставленных в очередь постов.
+    """
+    count = 0
+    posts = Post.objects.exclude(image='').filter(thumbnail='')
+    for post in posts.only('pk', 'image').iterator():
+        schedule(post)
+        count += 1
+    return count
+
+
+def wait():
+    """Дожидается миниатюр, отданных в пул, — для команд manage.py."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def generate(post_id, image_name):
+    source_path = Post._meta.get_field('image').storage.path(image_name)
+    try:
+        digest = source_digest(image_name, source_path)
+    except OSError:
+        logger.exception('Не удалось сделать миниатюру поста %s', post_id)
+        return
+    name = THUMBNAIL_NAME.format(
+        post_id=post_id,
+        digest=digest,
+        width=CARD_SIZE[0],
+        height=CARD_SIZE[1],
+    )
+    args = (source_path, default_storage.path(name), CARD_SIZE)
+    if not settings.THUMBNAIL_WORKERS:
+        try:
+            size = render_variant(*args)
+        except Exception:
+            logger.exception('Не удалось сделать миниатюру поста %s', post_id)
+            return
+        store(post_id, image_name, name, size)
+        return
+    future = get_executor().submit(render_variant, *args)
+    future.add_done_callback(
+        partial(_store_result, post_id, image_name, name)
+    )
+
+
+def store(post_id, image_name, name, size):
+    """Записывает миниатюру в пост и сбрасывает кэш лент с ним.
+
+    Миниатюра записывается одним условным UPDATE, только если у поста
+    всё та же картинка image_name и прежняя миниатюра: результат,
+    опоздавший после замены картинки или удаления поста, удаляется.
+    Транзакцию поток пула не держит, чтобы не блокировать таблицу.
+    Прежняя миниатюра поста удаляется после коммита.
+    """
+    width, height = size
+    posts = Post.objects.filter(pk=post_id, image=image_name)
+    previous = posts.values_list('thumbnail', flat=True).first()
+    updated = previous is not None and posts.filter(
+        thumbnail=previous
+    ).update(
+        thumbnail=name,
+        thumbnail_width=width,
+        thumbnail_height=height,
+        updated=timezone.now(),
+    )
+    if not updated:
+        if not Post.objects.filter(pk=post_id, thumbnail=name).exists():
+            release(name)
+        return
+    if previous and previous != name:
+        release(previous)
+    post = Post.objects.select_related('author', 'group').filter(
+        pk=post_id
+    ).first()
+    if post is not None:
+        invalidate(*post_scopes(post))
+
+
+def release(name):
+    """Удаляет файл миниатюры после коммита."""
+    transaction.on_commit(partial(default_storage.delete, name))
+
+
+def _store_result(post_id, image_name, name, future):
+    close_old_connections()
+    try:
+        store(post_id, image_name, name, future.result())
+    except Exception:
+        logger.exception('Не удалось сделать миниатюру поста %s', post_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,123 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from yatube.settings import (TRENDING_GROUP_COUNT, TRENDING_HALF_LIFE,
+                             TRENDING_POST_COUNT)
+
+from .caching import TRENDING_SCOPE, invalidate
+from .models import Comment, Group, Post
+
+# Счёт хранится как логарифм суммы весов событий, приведённых к EPOCH:
+# log Σ w·2^((t - EPOCH) / T). Затухание одинаково для всех записей,
+# поэтому порядок не меняется со временем и пересчитывать счета
+# по расписанию не нужно, а новое событие — это одно сложение.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+DECAY = math.log(2) / TRENDING_HALF_LIFE
+POST_WEIGHT = 1
+# Обсуждение говорит о живом интересе больше, чем сама публикация.
+COMMENT_WEIGHT = 2
+
+
+def log_weight(weight, moment):
+    """Вес события в момент moment в логарифмической шкале счёта."""
+    return math.log(weight) + DECAY * (moment - EPOCH).total_seconds()
+
+
+def log_add(first, second):
+    """log(e^first + e^second) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def add_event(model, pk, weight, moment):
+    """Прибавляет событие к счёту записи.
+
+    Чтение и запись идут в одной транзакции с блокировкой строки, чтобы
+    параллельные события не затёрли друг друга.
+    """
+    with transaction.atomic():
+        current = model.objects.select_for_update().filter(
+            pk=pk
+        ).values_list('trending', flat=True).first()
+        if current is None:
+            return
+        model.objects.filter(pk=pk).update(
+            trending=log_add(current, log_weight(weight, moment))
+        )
+
+
+def count_post(post):
+    add_event(Post, post.pk, POST_WEIGHT, post.created)
+    if post.group_id is not None:
+        add_event(Group, post.group_id, POST_WEIGHT, post.created)
+
+
+def count_comment(comment):
+    add_event(Post, comment.post_id, COMMENT_WEIGHT, comment.created)
+    group_id = Post.objects.filter(pk=comment.post_id).values_list(
+        'group_id', flat=True
+    ).first()
+    if group_id is not None:
+        add_event(Group, group_id, COMMENT_WEIGHT, comment.created)
+
+
+def total(events):
+    """Счёт по списку событий (вес, момент); 0, если их нет."""
+    score = None
+    for weight, moment in events:
+        value = log_weight(weight, moment)
+        score = value if score is None else log_add(score, value)
+    return 0 if score is None else score
+
+
+def rebuild_post_trending(post_ids):
+    """Пересчитывает счета постов с нуля — после удалений и импорта."""
+    events = defaultdict(list)
+    for pk, created in Post.objects.filter(pk__in=post_ids).values_list(
+        'pk', 'created'
+    ):
+        events[pk].append((POST_WEIGHT, created))
+    for pk, created in Comment.objects.filter(
+        post_id__in=post_ids
+    ).values_list('post_id', 'created'):
+        events[pk].append((COMMENT_WEIGHT, created))
+    Post.objects.bulk_update(
+        [Post(pk=pk, trending=total(items)) for pk, items in events.items()],
+        ['trending'],
+    )
+
+
+def rebuild_group_trending(group_ids):
+    """Пересчитывает счета групп по их постам и комментариям к ним."""
+    events = {pk: [] for pk in group_ids}
+    for pk, created in Post.objects.filter(
+        group_id__in=group_ids
+    ).values_list('group_id', 'created'):
+        events[pk].append((POST_WEIGHT, created))
+    for pk, created in Comment.objects.filter(
+        post__group_id__in=group_ids
+    ).values_list('post__group_id', 'created'):
+        events[pk].append((COMMENT_WEIGHT, created))
+    Group.objects.bulk_update(
+        [Group(pk=pk, trending=total(items))
+         for pk, items in events.items()],
+        ['trending'],
+    )
+    invalidate(TRENDING_SCOPE)
+
+
+def top_posts(count=TRENDING_POST_COUNT):
+    """Самые популярные посты: первые строки индекса по счёту."""
+    return list(
+        Post.objects.for_feed().order_by('-trending', '-pk')[:count]
+    )
+
+
+def top_groups(count=TRENDING_GROUP_COUNT):
+    return list(
+        Group.objects.only('title', 'slug', 'post_count')
+        .order_by('-trending', '-pk')[:count]
+    )
@@ -1,7 +1,15 @@
-from django.core.paginator import Paginator
+from yatube.settings import LEGACY_PAGE_LIMIT, PAGINATOR_WINDOW
 
+from .paginator import KeysetPaginator
 
-def get_page_obj(request, post_list, page_capacity):
-    paginator = Paginator(post_list, page_capacity)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+
+def get_page_obj(request, post_list, page_capacity, tie_key='id',
+                 count=None):
+    paginator = KeysetPaginator(
+        post_list, page_capacity, LEGACY_PAGE_LIMIT, tie_key,
+        count=count, window=PAGINATOR_WINDOW,
+    )
+    return paginator.get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
@@ -1,22 +1,37 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
-from yatube.settings import PAGE_CAPACITY
+from core.identity import load_object_or_404
+from core.sqlite import single_writer
+
+from yatube.settings import (COMMENT_PAGE_CAPACITY, LEGACY_PAGE_LIMIT,
+                             PAGE_CAPACITY, PAGINATOR_WINDOW)
 
+from . import thumbnails, trending
+from .caching import GROUP_SCOPE, INDEX_SCOPE, PROFILE_SCOPE, cache_feed
+from .conditional import (conditional, group_state, index_state, post_state,
+                          profile_state)
+from .counters import estimate_count, get_user_stats
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
+from .models import Follow, Group, Post, TimelineEntry
+from .search import SearchPaginator, build_match
 from .utils import get_page_obj
 
 User = get_user_model()
 
 
-@cache_page(20, key_prefix='index_page')
+@conditional(index_state)
+@cache_feed(INDEX_SCOPE)
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
-    page_obj = get_page_obj(request, post_list, PAGE_CAPACITY)
+    post_list = Post.objects.for_feed()
+    page_obj = get_page_obj(
+        request, post_list, PAGE_CAPACITY,
+        count=estimate_count('index', Post.objects),
+    )
     title = 'Последние обновления на сайте'
     index = True
     context = {
@@ -27,11 +42,28 @@ def index(request):
     return render(request, template, context)
 
 
+# Счета меняются только вместе с постами и комментариями, а они
+# обновляют и валидаторы, и версию области главной ленты.
+@conditional(index_state)
+@cache_feed(INDEX_SCOPE)
+def trending_posts(request):
+    template = 'posts/trending.html'
+    context = {
+        'title': 'Популярное',
+        'posts': trending.top_posts(),
+    }
+    return render(request, template, context)
+
+
+@conditional(group_state)
+@cache_feed(GROUP_SCOPE)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = get_page_obj(request, post_list, PAGE_CAPACITY)
+    group = load_object_or_404(request, Group.objects, slug=slug)
+    post_list = group.posts.for_feed()
+    page_obj = get_page_obj(
+        request, post_list, PAGE_CAPACITY, count=group.post_count
+    )
     title = 'Записи сообщества ' + group.title
     context = {
         'title': title,
@@ -41,58 +73,103 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@conditional(profile_state)
+@cache_feed(PROFILE_SCOPE)
 def profile(request, username):
     template = 'posts/profile.html'
 
-    this_user = get_object_or_404(User, username=username)
-    post_list = this_user.posts.all()
-    page_obj = get_page_obj(request, post_list, PAGE_CAPACITY)
+    this_user = load_object_or_404(
+        request,
+        User.objects.select_related('stats'),
+        username=username
+    )
+    stats = get_user_stats(this_user)
+    post_list = this_user.posts.for_feed()
+    page_obj = get_page_obj(
+        request, post_list, PAGE_CAPACITY, count=stats.post_count
+    )
 
-    post_amount = this_user.posts.count()
     title = 'Профайл пользователя ' + this_user.get_username()
 
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user,
-            author=get_object_or_404(User, username=username)
-        ).exists()
-    else:
-        following = False
-
     context = {
         'title': title,
         'this_user': this_user,
         'page_obj': page_obj,
-        'post_amount': post_amount,
-        'following': following,
+        'post_amount': stats.post_count,
+        'stats': stats,
     }
     return render(request, template, context)
 
 
+@conditional(post_state)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
 
-    this_post = get_object_or_404(Post, id=post_id)
+    this_post = load_object_or_404(
+        request,
+        Post.objects.select_related('author__stats', 'group'),
+        id=post_id
+    )
     title = 'Пост "' + this_post.text[:30] + '..."'
 
-    this_author = this_post.author.username
-    this_user = get_object_or_404(User, username=this_author)
-    post_amount = this_user.posts.count()
+    post_amount = get_user_stats(this_post.author).post_count
 
-    comments_list = this_post.comments.all()
+    comments = get_comments_page(request, this_post)
     comment_form = CommentForm()
 
     context = {
         'title': title,
         'post_amount': post_amount,
         'post': this_post,
-        'comments': comments_list,
+        'comments': comments,
         'form': comment_form,
     }
     return render(request, template, context)
 
 
+def post_comments(request, post_id):
+    """Порция комментариев без обвязки страницы — для подгрузки."""
+    template = 'posts/includes/comments.html'
+    this_post = get_object_or_404(
+        Post.objects.only('comment_count'), id=post_id
+    )
+    context = {
+        'post': this_post,
+        'comments': get_comments_page(request, this_post),
+    }
+    return render(request, template, context)
+
+
+def get_comments_page(request, post):
+    return get_page_obj(
+        request, post.comments.for_thread(), COMMENT_PAGE_CAPACITY,
+        count=post.comment_count,
+    )
+
+
+def search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(
+        build_match(query), PAGE_CAPACITY, LEGACY_PAGE_LIMIT,
+        PAGINATOR_WINDOW,
+    )
+    page_obj = paginator.get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
+    title = 'Поиск по записям'
+    context = {
+        'title': title,
+        'query': query,
+        'page_obj': page_obj,
+        'extra_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, template, context)
+
+
 @login_required
+@single_writer
 def post_create(request):
     template = 'posts/create_post.html'
 
@@ -104,6 +181,7 @@ def post_create(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        thumbnails.schedule(new_post)
         return redirect('posts:profile', request.user.username)
 
     context = {
@@ -113,6 +191,7 @@ def post_create(request):
 
 
 @login_required
+@single_writer
 def post_edit(request, post_id):
     this_post = get_object_or_404(Post, id=post_id)
 
@@ -124,6 +203,8 @@ def post_edit(request, post_id):
         )
         if form.is_valid():
             form.save()
+            if 'image' in form.changed_data:
+                thumbnails.schedule(this_post)
             return redirect('posts:post_detail', post_id)
 
         template = 'posts/create_post.html'
@@ -138,6 +219,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@single_writer
 def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
 
@@ -153,8 +235,12 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_page_obj(request, post_list, PAGE_CAPACITY)
+    entries = TimelineEntry.objects.filter(user=request.user)
+    page_obj = get_page_obj(
+        request, entries.for_feed(), PAGE_CAPACITY, 'post_id',
+        count=estimate_count(f'timeline:{request.user.pk}', entries),
+    )
+    page_obj.object_list = [entry.post for entry in page_obj]
     title = 'Последние обновления в ленте подписок'
     follow = True
     context = {
@@ -166,6 +252,7 @@ def follow_index(request):
 
 
 @login_required
+@single_writer(always=True)
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
@@ -177,6 +264,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@single_writer(always=True)
 def profile_unfollow(request, username):
     Follow.objects.filter(
         user=request.user,
@@ -51,11 +51,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -66,7 +68,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.InstrumentedTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -88,6 +90,44 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Some constatnts
 
 PAGE_CAPACITY = 10
+# Комментариев на странице поста и в каждой подгружаемой порции
+COMMENT_PAGE_CAPACITY = 20
+
+# Сколько первых страниц ленты доступно по старым ссылкам `?page=N`
+LEGACY_PAGE_LIMIT = 5
+# Сколько номеров страниц показывать по обе стороны от текущей
+PAGINATOR_WINDOW = 2
+# Сколько живёт посчитанное число записей ленты без счётчика
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+# Ленты живут в кэше, пока их не сбросят сигналы об изменениях
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Доля, на которую случайно сокращается срок свежести страницы
+FEED_CACHE_JITTER = 0.1
+# Сколько устаревшая страница отдаётся, пока её пересобирает один запрос
+FEED_STALE_TIMEOUT = 60 * 10
+# Сколько живёт блокировка пересборки, если запрос упал
+FEED_LOCK_TIMEOUT = 30
+# Карточки постов в кэше; ключ меняется вместе с постом
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Снимок графа подписок в кэше; сигналы обновляют его сразу
+FOLLOW_GRAPH_TIMEOUT = 60 * 60
+# Сколько массивов подписок процесс держит в памяти
+FOLLOW_GRAPH_LOCAL_SIZE = 10000
+
+# Сколько рекомендаций «Кого почитать» хранить и сколько показывать
+RECOMMENDATION_TOP_K = 20
+RECOMMENDATION_COUNT = 5
+
+# Через сколько секунд вес поста или комментария в популярном
+# уменьшается вдвое; сколько постов и групп там показывать
+TRENDING_HALF_LIFE = 60 * 60 * 12
+TRENDING_POST_COUNT = 10
+TRENDING_GROUP_COUNT = 5
+
+# Процессов для подготовки миниатюр; 0 — делать их прямо в запросе
+THUMBNAIL_WORKERS = 2
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -96,19 +136,89 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Соединение и его прагмы переживают запрос
+        'CONN_MAX_AGE': 60,
+    },
+    # Копия основной базы для чтения, её обновляет manage.py sync_replicas
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Прагмы каждого соединения SQLite: WAL пускает читателей параллельно
+# с писателем, mmap и кэш страниц снимают чтение с системных вызовов,
+# а busy_timeout ждёт блокировку вместо ошибки
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — объём в КиБ, а не число страниц
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+# Изменяющие запросы идут по одному через очередь писателей; замок
+# очереди — файл рядом с базой. Запись, всё же упёршуюся в блокировку,
+# повторяем с задержкой, удваивая её
+SQLITE_SERIALIZE_WRITES = True
+SQLITE_WRITE_LOCK = os.path.join(BASE_DIR, 'db.sqlite3.lock')
+SQLITE_WRITE_RETRIES = 5
+SQLITE_WRITE_BACKOFF = 0.05
+
+# Базы, с которых читают GET-запросы; пустой список — всё в default.
+# Реплику включают, когда sync_replicas --interval уже обновляет её
+REPLICA_DATABASES = []
+# Сколько секунд после записи пользователь читает с основной базы
+REPLICA_PIN_SECONDS = 10
+
+# Локальный LRU каждого процесса перед общим для процессов файловым кэшем
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+            'LOCAL_TIMEOUT': 5,
+            # Выход и смена пароля должны сразу действовать во всех
+            # процессах, поэтому сессии и пользователи — только в общем кэше.
+            # Подписка тоже: иначе другой процесс ещё LOCAL_TIMEOUT секунд
+            # показывал бы старую кнопку «Подписаться».
+            'SHARED_PREFIXES': [
+                'feed_version:',
+                'feed_lock:',
+                'django.contrib.sessions.cached_db',
+                'auth_user:',
+                'follow_graph:',
+            ],
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SharedFileCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
 }
 
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Метрики запросов: каждый процесс пишет свой файл, /metrics их складывает
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+
+# Сессии читаются из кэша и пишутся в него и в базу
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Сколько пользователь сессии живёт в кэше между сохранениями
+AUTH_USER_CACHE_TIMEOUT = 60 * 5
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 